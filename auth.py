@@ -1,9 +1,20 @@
 import streamlit as st
-from auth_db import AuthDB
+from auth_db import get_auth_db
+from tenants import get_tenant_router
+import ipaddress
+import os
 import re
 
 def init_auth():
     """Initialize authentication session state"""
+    if 'tenant' not in st.session_state:
+        st.session_state.tenant = get_tenant_param()
+    # Schema migrations run on the first call in this process only
+    try:
+        get_db()
+    except KeyError:
+        st.error(f"❌ Unknown institution: {st.session_state.tenant}")
+        st.stop()
     if 'logged_in' not in st.session_state:
         st.session_state.logged_in = False
     if 'user_info' not in st.session_state:
@@ -17,6 +28,85 @@ def init_auth():
     if 'stored_reset_token' not in st.session_state:
         st.session_state.stored_reset_token = None
 
+def get_tenant_param():
+    """Tenant id from the ?tenant= query parameter, or None for the default database"""
+    try:
+        tenant = st.query_params.get("tenant")
+    except AttributeError:
+        tenant = st.experimental_get_query_params().get("tenant", [None])[0]
+    return tenant.strip().lower() if tenant else None
+
+def get_db():
+    """AuthDB shard for this session's institution, or the shared users.db"""
+    tenant = st.session_state.get('tenant')
+    if tenant:
+        return get_tenant_router().get(tenant)
+    return get_auth_db()
+
+def _trusted_proxies():
+    """Networks from TRUSTED_PROXIES (comma-separated IPs or CIDRs)"""
+    networks = []
+    for entry in os.environ.get("TRUSTED_PROXIES", "").split(","):
+        if entry.strip():
+            networks.append(ipaddress.ip_network(entry.strip(), strict=False))
+    return networks
+
+# X-Forwarded-For is only honoured behind proxies configured here: either
+# their addresses (TRUSTED_PROXIES) or how many there are (TRUSTED_PROXY_COUNT)
+TRUSTED_PROXIES = _trusted_proxies()
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+
+def _is_trusted(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def forwarded_client_ip(forwarded, peer, trusted_count=None):
+    """The right-most X-Forwarded-For hop not added by a trusted proxy
+    
+    Entries to the left of that hop are written by the client and can't
+    be trusted. Returns None when no proxy is configured or the request
+    didn't come through one.
+    """
+    trusted_count = TRUSTED_PROXY_COUNT if trusted_count is None else trusted_count
+    hops = [hop.strip() for hop in (forwarded or "").split(",") if hop.strip()]
+    if not hops:
+        return None
+    if TRUSTED_PROXIES:
+        if peer is None or not _is_trusted(peer):
+            return None
+        for hop in reversed(hops):
+            if not _is_trusted(hop):
+                return hop
+        return hops[0]
+    if trusted_count > 0 and len(hops) >= trusted_count:
+        return hops[-trusted_count]
+    return None
+
+def get_client_id():
+    """Best-effort client identity for login throttling
+    
+    Uses the forwarded client IP when the app runs behind configured
+    trusted proxies, otherwise the browser session, so attempts from one
+    client share a rate limit.
+    """
+    try:
+        client_ip = forwarded_client_ip(st.context.headers.get("X-Forwarded-For"), st.context.ip_address)
+        if client_ip:
+            return client_ip
+    except Exception:
+        pass
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return None
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -55,8 +145,8 @@ def show_login_page():
             if not username or not password:
                 st.markdown('<div class="error-msg">❌ Please fill in all fields!</div>', unsafe_allow_html=True)
             else:
-                db = AuthDB()
-                success, result = db.login_user(username, password)
+                db = get_db()
+                success, result = db.login_user(username, password, client_id=get_client_id())
                 
                 if success:
                     st.session_state.logged_in = True
@@ -138,7 +228,7 @@ def show_register_page():
             elif password != confirm_password:
                 st.markdown('<div class="error-msg">❌ Passwords don\'t match!</div>', unsafe_allow_html=True)
             else:
-                db = AuthDB()
+                db = get_db()
                 success, message = db.register_user(username, email, password)
                 
                 if success:
@@ -178,8 +268,8 @@ def show_forgot_password_page():
                 if not email or not validate_email(email):
                     st.markdown('<div class="error-msg">❌ Please enter a valid email!</div>', unsafe_allow_html=True)
                 else:
-                    db = AuthDB()
-                    success, result = db.generate_reset_token(email)
+                    db = get_db()
+                    success, result = db.generate_reset_token(email, client_id=get_client_id())
                     
                     if success:
                         st.session_state.reset_email = email
@@ -233,7 +323,7 @@ def show_forgot_password_page():
                 elif new_password != confirm_password:
                     st.markdown('<div class="error-msg">❌ Passwords don\'t match!</div>', unsafe_allow_html=True)
                 else:
-                    db = AuthDB()
+                    db = get_db()
                     # Verify token
                     verified, msg = db.verify_reset_token(st.session_state.reset_email, reset_code)
                     
@@ -485,3 +575,14 @@ def get_current_user():
     if st.session_state.get('logged_in', False):
         return st.session_state.get('user_info', None)
     return None
+
+def get_usage_key():
+    """Key for the current user's Gemini quota
+    
+    User ids are only unique within one institution, so the tenant is
+    part of the key.
+    """
+    user = get_current_user()
+    if user is None:
+        return None
+    return f"{st.session_state.get('tenant') or 'default'}:{user['id']}"
@@ -1,122 +1,381 @@
 import sqlite3
-import hashlib
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import secrets
+import threading
+import time
+from background import PeriodicTask
+from backup_db import schedule_backups
+from db_pool import RetryPolicy
+from storage import make_backend
+from write_behind import LastLoginBuffer
+from password_hashing import PasswordHasher
+from ttl_cache import TTLCache
+from rate_limit import LoginThrottle
+
+# Rows per IN (...) lookup in bulk_register; SQLite before 3.32 allows
+# only 999 bound variables per statement
+LOOKUP_BATCH = 900
+
+# Ordered schema migrations as (version, description, statements).
+# Append new entries with the next version number; never edit one that
+# has already shipped, since applied versions are skipped on startup.
+MIGRATIONS = [
+    (1, "create users table", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            last_login TEXT,
+            reset_token TEXT,
+            reset_token_expiry TEXT
+        )
+        ''',
+    ]),
+    (2, "covering index for password reset lookups", [
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_email_reset
+        ON users (email, reset_token, reset_token_expiry)
+        ''',
+    ]),
+    (3, "move reset tokens to their own table", [
+        '''
+        CREATE TABLE IF NOT EXISTS reset_tokens (
+            user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+            token TEXT NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reset_tokens_expires_at
+        ON reset_tokens (expires_at)
+        ''',
+        # Old expiries are local-time strings; 'utc' converts them to epoch
+        '''
+        INSERT OR REPLACE INTO reset_tokens (user_id, token, expires_at)
+        SELECT id, reset_token, CAST(strftime('%s', reset_token_expiry, 'utc') AS INTEGER)
+        FROM users
+        WHERE reset_token IS NOT NULL AND reset_token_expiry IS NOT NULL
+        ''',
+        'DROP INDEX IF EXISTS idx_users_email_reset',
+    ] + ([
+        # DROP COLUMN needs SQLite 3.35+; older versions just keep them unused
+        'ALTER TABLE users DROP COLUMN reset_token',
+        'ALTER TABLE users DROP COLUMN reset_token_expiry',
+    ] if sqlite3.sqlite_version_info >= (3, 35, 0) else [])),
+]
+
+# The same schema for PostgreSQL. Version numbers match MIGRATIONS, so
+# schema_version() means the same thing on either backend.
+POSTGRES_MIGRATIONS = [
+    (1, "create users table", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            last_login TEXT
+        )
+        ''',
+    ]),
+    (2, "covering index for password reset lookups", []),
+    (3, "move reset tokens to their own table", [
+        '''
+        CREATE TABLE IF NOT EXISTS reset_tokens (
+            user_id BIGINT PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+            token TEXT NOT NULL,
+            expires_at BIGINT NOT NULL
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_reset_tokens_expires_at
+        ON reset_tokens (expires_at)
+        ''',
+    ]),
+]
+
+MIGRATIONS_BY_DIALECT = {
+    'sqlite': MIGRATIONS,
+    'postgresql': POSTGRES_MIGRATIONS,
+}
+
+RESET_TOKEN_TTL = timedelta(minutes=15)
 
 class AuthDB:
     """Database handler for user authentication"""
     
-    def __init__(self, db_path="users.db"):
+    def __init__(self, db_path="users.db", pool_size=8, busy_timeout_ms=5000, pragmas=None,
+                 write_behind=False, flush_interval=2.0, flush_size=200, hasher=None,
+                 user_cache_size=1024, user_cache_ttl=60.0, throttle=True,
+                 token_sweep_interval=300, backup_dir=None, backup_interval=3600, backup_keep=24,
+                 backend=None, throttle_scope=None):
         self.db_path = db_path
+        # SQLite file by default; a postgresql:// db_path (or an explicit
+        # backend) lets several app replicas share one accounts database
+        self.backend = backend or make_backend(db_path, pool_size=pool_size,
+                                               busy_timeout_ms=busy_timeout_ms, pragmas=pragmas)
+        if backup_dir and self.backend.dialect != 'sqlite':
+            raise ValueError("backup_dir only works with SQLite; use the database server's own backups")
+        # Login/reset attempt limits; pass False to disable (e.g. benchmarks)
+        if throttle is True:
+            throttle = LoginThrottle()
+        self.throttle = throttle or None
+        # Prefix for account keys when one throttle is shared by several databases
+        self.throttle_scope = throttle_scope
+        # KDF hashing runs on the hasher's bounded worker pool
+        self.hasher = hasher or PasswordHasher()
+        # Busy/locked errors on writes are retried instead of surfacing
+        self.retry = RetryPolicy(retryable=self.backend.is_busy_error)
         self.init_db()
+        # Optional: buffer last_login stamps instead of writing on every login
+        self.last_login_buffer = None
+        if write_behind:
+            self.last_login_buffer = LastLoginBuffer(
+                self.backend, flush_interval=flush_interval, max_pending=flush_size,
+                retry=self.retry
+            )
+        # Read-through cache of user rows keyed by username
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        # Bulk-delete expired reset tokens in the background
+        self.token_sweeper = None
+        if token_sweep_interval:
+            self.token_sweeper = PeriodicTask(
+                token_sweep_interval, self.purge_expired_reset_tokens, name="reset-token-sweeper"
+            ).start()
+        # Optional in-process online backups with snapshot rotation
+        self.backup_job = None
+        if backup_dir:
+            self.backup_job = schedule_backups(self.backend.db_path, backup_dir, interval=backup_interval, keep=backup_keep)
     
     def init_db(self):
-        """Initialize the database with users table"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Bring the schema up to date by applying pending migrations"""
+        def migrate():
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TEXT NOT NULL
+                    )
+                ''')
+                conn.commit()
+                
+                # Take the write lock up front so concurrent processes
+                # starting together don't apply the same migration twice
+                self.backend.lock_schema(cursor)
+                try:
+                    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+                    current = cursor.fetchone()[0]
+                    
+                    for version, description, statements in MIGRATIONS_BY_DIALECT[self.backend.dialect]:
+                        if version <= current:
+                            continue
+                        for statement in statements:
+                            cursor.execute(statement)
+                        cursor.execute('''
+                            INSERT INTO schema_version (version, description, applied_at)
+                            VALUES (?, ?, ?)
+                        ''', (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+                    
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                last_login TEXT,
-                reset_token TEXT,
-                reset_token_expiry TEXT
-            )
-        ''')
+        self.retry.run(migrate)
+    
+    def schema_version(self):
+        """Return the currently applied schema version"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+            return cursor.fetchone()[0]
+    
+    def _write(self, fn):
+        """Run fn(cursor) in a write transaction, retrying busy/locked errors
         
-        conn.commit()
-        conn.close()
+        On SQLite, BEGIN IMMEDIATE takes the write lock up front, so a busy
+        database is reported (and retried) before any work is done, rather
+        than failing later when a read transaction tries to upgrade.
+        """
+        def attempt():
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                self.backend.begin_write(cursor)
+                try:
+                    result = fn(cursor)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                return result
+        return self.retry.run(attempt)
+    
+    def _error_message(self, e):
+        """User-facing text for an unexpected database error"""
+        if self.backend.is_busy_error(e):
+            return "Server is busy right now. Please try again in a moment."
+        return f"Error: {str(e)}"
+    
+    def contention_stats(self):
+        """Write retry and lock-wait counters"""
+        return self.retry.stats()
     
     def hash_password(self, password):
-        """Hash password using SHA256"""
-        salt = "ai_study_planner_2026"  # In production, use unique salt per user
-        return hashlib.sha256((password + salt).encode()).hexdigest()
+        """Hash password with a per-user salt using the configured KDF"""
+        return self.hasher.hash(password)
     
     def register_user(self, username, email, password):
         """Register a new user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             password_hash = self.hash_password(password)
             created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            cursor.execute('''
+            self._write(lambda cursor: cursor.execute('''
                 INSERT INTO users (username, email, password_hash, created_at)
                 VALUES (?, ?, ?, ?)
-            ''', (username, email, password_hash, created_at))
+            ''', (username, email, password_hash, created_at)))
             
-            conn.commit()
-            conn.close()
             return True, "Registration successful!"
         
-        except sqlite3.IntegrityError as e:
+        except self.backend.IntegrityError as e:
             if "username" in str(e):
                 return False, "Username already exists!"
             elif "email" in str(e):
                 return False, "Email already registered!"
             return False, "Registration failed!"
         except Exception as e:
-            return False, f"Error: {str(e)}"
+            return False, self._error_message(e)
     
-    def login_user(self, username, password):
-        """Verify user credentials"""
-        try:
-            conn = sqlite3.connect(self.db_path)
+    def _load_user(self, username):
+        """Fetch (id, username, email, created_at, last_login) through the
+        user cache; password hashes are never cached"""
+        user = self.user_cache.get(username)
+        if user is None:
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, username, email, created_at, last_login
+                    FROM users
+                    WHERE username = ?
+                ''', (username,))
+                user = cursor.fetchone()
+            if user:
+                user = tuple(user)
+                self.user_cache.set(username, user)
+        return user
+    
+    def _load_credentials(self, username):
+        """Fetch (id, username, email, created_at, last_login, password_hash)
+        straight from the database, so a reset on any replica counts at once"""
+        with self.backend.connection() as conn:
             cursor = conn.cursor()
-            
-            password_hash = self.hash_password(password)
-            
             cursor.execute('''
-                SELECT id, username, email, created_at
+                SELECT id, username, email, created_at, last_login, password_hash
                 FROM users
-                WHERE username = ? AND password_hash = ?
-            ''', (username, password_hash))
+                WHERE username = ?
+            ''', (username,))
+            return cursor.fetchone()
+    
+    def invalidate_user(self, username):
+        """Drop a cached user row; call after any write to that user"""
+        self.user_cache.invalidate(username)
+    
+    def cache_stats(self):
+        """Hit/miss counters for the user cache"""
+        return self.user_cache.stats()
+    
+    def _throttle_account(self, account):
+        return f"{self.throttle_scope}:{account}" if self.throttle_scope else account
+    
+    def _throttled(self, action, account, client_id):
+        """Rejection message if this attempt is over its limit, else None"""
+        if self.throttle is None:
+            return None
+        allowed, retry_after = self.throttle.check(action, self._throttle_account(account), client_id)
+        if allowed:
+            return None
+        return f"Too many attempts. Please try again in {max(1, round(retry_after))} seconds."
+    
+    def login_user(self, username, password, client_id=None):
+        """Verify user credentials and stamp last_login"""
+        try:
+            # Checked before any hashing or database work
+            throttled = self._throttled('login', username, client_id)
+            if throttled:
+                return False, throttled
             
-            user = cursor.fetchone()
+            user = self._load_credentials(username)
             
-            if user:
-                # Update last login
-                cursor.execute('''
-                    UPDATE users
-                    SET last_login = ?
-                    WHERE username = ?
-                ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), username))
-                conn.commit()
-                
-                conn.close()
-                return True, {
-                    'id': user[0],
-                    'username': user[1],
-                    'email': user[2],
-                    'created_at': user[3]
-                }
-            else:
-                conn.close()
+            # Hash outside the connection so slow KDFs don't hold it
+            if not user or not self.hasher.verify(password, user[5]):
                 return False, "Invalid username or password!"
+            # Only failed attempts count against the account
+            if self.throttle is not None:
+                self.throttle.succeeded('login', self._throttle_account(username))
+            
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            upgraded_hash = None
+            if self.hasher.needs_upgrade(user[5]):
+                upgraded_hash = self.hasher.hash(password)
+            
+            if upgraded_hash is None and self.last_login_buffer is not None:
+                # The stamp is written in the next batch, so keep the
+                # cached row current - unless it changed during the verify
+                self.last_login_buffer.stamp(user[0], now)
+                self.user_cache.replace(username, tuple(user[:5]), tuple(user[:4]) + (now,))
+            else:
+                # Guard on the old hash so a concurrent reset isn't undone
+                self._write(lambda cursor: cursor.execute('''
+                    UPDATE users
+                    SET last_login = ?, password_hash = COALESCE(?, password_hash)
+                    WHERE id = ? AND password_hash = ?
+                ''', (now, upgraded_hash, user[0], user[5])))
+                # Cached last_login (and maybe the hash) is now stale
+                self.invalidate_user(username)
+            
+            return True, {
+                'id': user[0],
+                'username': user[1],
+                'email': user[2],
+                'created_at': user[3]
+            }
         
         except Exception as e:
-            return False, f"Error: {str(e)}"
+            return False, self._error_message(e)
+    
+    def flush_last_logins(self):
+        """Write buffered last_login stamps now (no-op without write-behind)"""
+        if self.last_login_buffer is None:
+            return 0
+        return self.last_login_buffer.flush()
+    
+    def release_connections(self):
+        """Flush buffered writes and close idle pooled connections, keeping
+        everything else (caches, throttle, background jobs) for reuse"""
+        self.flush_last_logins()
+        self.backend.close()
+    
+    def close(self):
+        """Flush buffered writes and close idle pooled connections"""
+        if self.token_sweeper is not None:
+            self.token_sweeper.stop()
+        if self.backup_job is not None:
+            self.backup_job.stop()
+        if self.last_login_buffer is not None:
+            self.last_login_buffer.close()
+        self.backend.close()
     
     def get_user_info(self, username):
         """Get user information"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT id, username, email, created_at, last_login
-                FROM users
-                WHERE username = ?
-            ''', (username,))
-            
-            user = cursor.fetchone()
-            conn.close()
+            user = self._load_user(username)
             
             if user:
                 return {
@@ -131,36 +390,173 @@ class AuthDB:
         except Exception as e:
             return None
     
-    def generate_reset_token(self, email):
-        """Generate password reset token for email"""
+    def bulk_register(self, rows):
+        """Register a chunk of users in one transaction
+        
+        Each row is a dict with username, email and either password or a
+        ready-made password_hash (e.g. from an export); created_at is
+        optional. Returns one (success, message) per row, in order.
+        Duplicates within the chunk or against existing users are
+        reported per row and skipped; the other rows are still inserted.
+        """
+        results = [None] * len(rows)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # Reject rows clashing with each other before touching the DB
+        seen_usernames, seen_emails, candidates = set(), set(), []
+        for i, row in enumerate(rows):
+            username, email = row.get('username'), row.get('email')
+            if not username or not email or not (row.get('password') or row.get('password_hash')):
+                results[i] = (False, "Missing username, email or password!")
+            elif username in seen_usernames:
+                results[i] = (False, "Username already exists!")
+            elif email in seen_emails:
+                results[i] = (False, "Email already registered!")
+            else:
+                seen_usernames.add(username)
+                seen_emails.add(email)
+                candidates.append(i)
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                if candidates:
+                    taken_usernames, taken_emails = set(), set()
+                    # IN lists in batches that stay under SQLite's variable limit
+                    for start in range(0, len(candidates), LOOKUP_BATCH):
+                        batch = candidates[start:start + LOOKUP_BATCH]
+                        marks = ','.join('?' * len(batch))
+                        cursor.execute(f'SELECT username FROM users WHERE username IN ({marks})',
+                                       [rows[i]['username'] for i in batch])
+                        taken_usernames.update(r[0] for r in cursor.fetchall())
+                        cursor.execute(f'SELECT email FROM users WHERE email IN ({marks})',
+                                       [rows[i]['email'] for i in batch])
+                        taken_emails.update(r[0] for r in cursor.fetchall())
+                    
+                    fresh = []
+                    for i in candidates:
+                        if rows[i]['username'] in taken_usernames:
+                            results[i] = (False, "Username already exists!")
+                        elif rows[i]['email'] in taken_emails:
+                            results[i] = (False, "Email already registered!")
+                        else:
+                            fresh.append(i)
+                    candidates = fresh
             
-            # Check if email exists
-            cursor.execute('SELECT id, username FROM users WHERE email = ?', (email,))
-            user = cursor.fetchone()
+            # Hash only the rows that will be inserted, in parallel
+            to_hash = [i for i in candidates if not rows[i].get('password_hash')]
+            hashes = dict(zip(to_hash, self.hasher.hash_many([rows[i]['password'] for i in to_hash])))
+            params = [
+                (rows[i]['username'], rows[i]['email'],
+                 hashes.get(i) or rows[i]['password_hash'], rows[i].get('created_at') or now)
+                for i in candidates
+            ]
             
-            if not user:
-                conn.close()
-                return False, "Email not found!"
+            insert_sql = '''
+                INSERT INTO users (username, email, password_hash, created_at)
+                VALUES (?, ?, ?, ?)
+            '''
+            
+            def insert_chunk(cursor):
+                outcome = {}
+                cursor.execute('SAVEPOINT chunk')
+                try:
+                    cursor.executemany(insert_sql, params)
+                    cursor.execute('RELEASE chunk')
+                    for i in candidates:
+                        outcome[i] = (True, "Registration successful!")
+                except self.backend.IntegrityError:
+                    # Someone registered a clashing user meanwhile; redo
+                    # this chunk row by row to find out which ones. Each row
+                    # gets a savepoint since a failed statement aborts the
+                    # whole transaction on PostgreSQL.
+                    cursor.execute('ROLLBACK TO chunk')
+                    cursor.execute('RELEASE chunk')
+                    for i, param in zip(candidates, params):
+                        cursor.execute('SAVEPOINT row_insert')
+                        try:
+                            cursor.execute(insert_sql, param)
+                            cursor.execute('RELEASE row_insert')
+                            outcome[i] = (True, "Registration successful!")
+                        except self.backend.IntegrityError as e:
+                            cursor.execute('ROLLBACK TO row_insert')
+                            cursor.execute('RELEASE row_insert')
+                            if "username" in str(e):
+                                outcome[i] = (False, "Username already exists!")
+                            elif "email" in str(e):
+                                outcome[i] = (False, "Email already registered!")
+                            else:
+                                outcome[i] = (False, "Registration failed!")
+                return outcome
+            
+            if candidates:
+                for i, result in self._write(insert_chunk).items():
+                    results[i] = result
+        
+        except Exception as e:
+            for i in range(len(rows)):
+                if results[i] is None:
+                    results[i] = (False, self._error_message(e))
+        
+        return results
+    
+    def iter_users(self, include_hashes=False, batch_size=1000):
+        """Stream every user as a dict, ordered by id"""
+        columns = ['id', 'username', 'email', 'created_at', 'last_login']
+        if include_hashes:
+            columns.append('password_hash')
+        
+        # Keyset pagination keeps each read short instead of holding a
+        # pooled connection (and a WAL snapshot) for the whole export
+        last_id = 0
+        while True:
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {', '.join(columns)}
+                    FROM users
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size))
+                batch = cursor.fetchall()
+            if not batch:
+                return
+            for row in batch:
+                yield dict(zip(columns, row))
+            last_id = batch[-1][0]
+    
+    def generate_reset_token(self, email, client_id=None):
+        """Generate password reset token for email"""
+        try:
+            throttled = self._throttled('reset', email, client_id)
+            if throttled:
+                return False, throttled
             
             # Generate reset token (6-digit code)
             reset_token = str(secrets.randbelow(900000) + 100000)
             
             # Token expires in 15 minutes
-            from datetime import datetime, timedelta
-            expiry = (datetime.now() + timedelta(minutes=15)).strftime('%Y-%m-%d %H:%M:%S')
+            expires_at = int(time.time() + RESET_TOKEN_TTL.total_seconds())
+            expiry = datetime.fromtimestamp(expires_at).strftime('%Y-%m-%d %H:%M:%S')
             
-            # Store token
-            cursor.execute('''
-                UPDATE users
-                SET reset_token = ?, reset_token_expiry = ?
-                WHERE email = ?
-            ''', (reset_token, expiry, email))
+            def store_token(cursor):
+                cursor.execute('SELECT id, username FROM users WHERE email = ?', (email,))
+                user = cursor.fetchone()
+                if user:
+                    # One live token per user; a new request replaces it
+                    cursor.execute('''
+                        INSERT INTO reset_tokens (user_id, token, expires_at)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET token = excluded.token, expires_at = excluded.expires_at
+                    ''', (user[0], reset_token, expires_at))
+                return user
             
-            conn.commit()
-            conn.close()
+            user = self._write(store_token)
+            
+            if not user:
+                return False, "Email not found!"
             
             return True, {
                 'username': user[1],
@@ -169,61 +565,107 @@ class AuthDB:
             }
         
         except Exception as e:
-            return False, f"Error: {str(e)}"
+            return False, self._error_message(e)
     
     def verify_reset_token(self, email, token):
         """Verify reset token"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT reset_token, reset_token_expiry
-                FROM users
-                WHERE email = ?
-            ''', (email,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            with self.backend.connection() as conn:
+                cursor = conn.cursor()
+                # UNIQUE(email) index into users, then the reset_tokens primary key
+                cursor.execute('''
+                    SELECT t.token, t.expires_at
+                    FROM users u
+                    JOIN reset_tokens t ON t.user_id = u.id
+                    WHERE u.email = ?
+                ''', (email,))
+                
+                result = cursor.fetchone()
             
-            if not result or not result[0]:
+            if not result:
                 return False, "No reset token found!"
             
-            stored_token, expiry = result
+            stored_token, expires_at = result
             
             # Check if token matches
             if stored_token != token:
                 return False, "Invalid reset code!"
             
             # Check if token expired
-            from datetime import datetime
-            expiry_time = datetime.strptime(expiry, '%Y-%m-%d %H:%M:%S')
-            if datetime.now() > expiry_time:
+            if time.time() > expires_at:
                 return False, "Reset code expired! Please request a new one."
             
             return True, "Token verified!"
         
         except Exception as e:
-            return False, f"Error: {str(e)}"
+            return False, self._error_message(e)
     
     def reset_password(self, email, new_password):
         """Reset password using verified email"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             password_hash = self.hash_password(new_password)
             
-            cursor.execute('''
-                UPDATE users
-                SET password_hash = ?, reset_token = NULL, reset_token_expiry = NULL
-                WHERE email = ?
-            ''', (password_hash, email))
+            def store_password(cursor):
+                if self.backend.has_returning:
+                    cursor.execute('''
+                        UPDATE users
+                        SET password_hash = ?
+                        WHERE email = ?
+                        RETURNING id, username
+                    ''', (password_hash, email))
+                    rows = cursor.fetchall()
+                else:
+                    cursor.execute('SELECT id, username FROM users WHERE email = ?', (email,))
+                    rows = cursor.fetchall()
+                    cursor.execute('''
+                        UPDATE users
+                        SET password_hash = ?
+                        WHERE email = ?
+                    ''', (password_hash, email))
+                cursor.executemany('DELETE FROM reset_tokens WHERE user_id = ?',
+                                   [(row[0],) for row in rows])
+                return rows
+            
+            rows = self._write(store_password)
             
-            conn.commit()
-            conn.close()
+            for row in rows:
+                self.invalidate_user(row[1])
             
             return True, "Password reset successful!"
         
         except Exception as e:
-            return False, f"Error: {str(e)}"
+            return False, self._error_message(e)
+    
+    def purge_expired_reset_tokens(self):
+        """Delete every expired reset token; returns the number removed"""
+        now = int(time.time())
+        return self._write(lambda cursor: cursor.execute(
+            'DELETE FROM reset_tokens WHERE expires_at <= ?', (now,)
+        ).rowcount)
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+def login_throttle_enabled():
+    """False when AUTH_LOGIN_THROTTLE=0, e.g. for load tests logging in many users from one client"""
+    return os.environ.get("AUTH_LOGIN_THROTTLE", "1") != "0"
+
+def get_auth_db(db_path=None, **options):
+    """Get the shared AuthDB instance for this process (schema set up once)
+
+    `db_path` defaults to the AUTH_DATABASE_URL environment variable, or
+    users.db when it is unset. `options` are passed to AuthDB on first
+    creation only, e.g. get_auth_db(write_behind=True) to batch
+    last_login writes.
+    """
+    db_path = db_path or os.environ.get("AUTH_DATABASE_URL", "users.db")
+    options.setdefault('throttle', login_throttle_enabled())
+    db = _instances.get(db_path)
+    if db is None:
+        with _instances_lock:
+            db = _instances.get(db_path)
+            if db is None:
+                db = AuthDB(db_path, **options)
+                _instances[db_path] = db
+    return db
@@ -0,0 +1,38 @@
+import threading
+
+
+class PeriodicTask:
+    """Runs fn() every `interval` seconds on a daemon thread
+
+    Errors are counted and remembered rather than raised, so one failed
+    run doesn't stop the schedule.
+    """
+
+    def __init__(self, interval, fn, name=None):
+        self.interval = interval
+        self.fn = fn
+        self.runs = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name or f"periodic-{fn.__name__}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_result = self.fn()
+                self.runs += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = e
+
+    def stop(self, timeout=5):
+        """Stop the schedule; a run already in progress is allowed to finish"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
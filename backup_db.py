@@ -0,0 +1,154 @@
+"""Online backups of users.db using SQLite's backup API
+
+The copy is made a few pages at a time with a short sleep between steps,
+so logins and registrations keep going while it runs. Each run writes a
+timestamped snapshot and older ones beyond --keep are deleted.
+
+Usage:
+    python backup_db.py                          # one snapshot into backups/
+    python backup_db.py --dest-dir /mnt/backups --keep 48
+    python backup_db.py --every 3600             # keep running, hourly
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from background import PeriodicTask
+
+
+class _TooSlow(Exception):
+    """Raised from the progress callback to abandon a stepwise copy"""
+
+
+def backup_database(src_path, dest_path, pages=64, sleep=0.005, max_seconds=60.0, verify=True):
+    """Copy src_path to dest_path online; returns a stats dict
+
+    Every write to the source from another connection restarts a
+    stepwise copy, so on a very busy database it might never finish.
+    After `max_seconds` the remainder is copied in a single step, which
+    in WAL mode only holds a read snapshot and does not block writers.
+    """
+    start = time.perf_counter()
+    tmp_path = dest_path + ".partial"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(tmp_path)
+    progress = {'total': 0, 'steps': 0}
+
+    def on_progress(status, remaining, total):
+        progress['total'] = total
+        progress['steps'] += 1
+        if time.perf_counter() - start > max_seconds:
+            raise _TooSlow()
+
+    single_step = False
+    try:
+        try:
+            try:
+                src.backup(dst, pages=pages, progress=on_progress, sleep=sleep)
+            except _TooSlow:
+                single_step = True
+                src.backup(dst, pages=-1)
+                progress['total'] = dst.execute('PRAGMA page_count').fetchone()[0]
+            if verify:
+                result = dst.execute('PRAGMA quick_check').fetchone()[0]
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(f"backup failed quick_check: {result}")
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        # Don't leave a half-written copy behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    duration = time.perf_counter() - start
+    return {
+        'path': dest_path,
+        'pages': progress['total'],
+        'steps': progress['steps'],
+        'bytes': os.path.getsize(dest_path),
+        'duration_seconds': round(duration, 3),
+        'pages_per_second': round(progress['total'] / duration, 1) if duration else None,
+        'single_step_fallback': single_step,
+    }
+
+
+def snapshot_path(dest_dir, prefix):
+    """A new snapshot path; names sort by time and never reuse an existing file"""
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(dest_dir, f"{prefix}-{stamp}.db")
+    n = 1
+    while os.path.exists(path) or os.path.exists(path + ".partial"):
+        path = os.path.join(dest_dir, f"{prefix}-{stamp}-{n}.db")
+        n += 1
+    return path
+
+
+def rotate_snapshots(dest_dir, prefix, keep):
+    """Delete all but the newest `keep` snapshots; returns removed paths"""
+    snapshots = sorted(glob.glob(os.path.join(dest_dir, f"{prefix}-*.db")), key=lambda path: (os.path.getmtime(path), path))
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def snapshot(src_path, dest_dir, keep=24, **options):
+    """Take a timestamped snapshot into dest_dir and rotate old ones"""
+    os.makedirs(dest_dir, exist_ok=True)
+    prefix = os.path.splitext(os.path.basename(src_path))[0]
+    stats = backup_database(src_path, snapshot_path(dest_dir, prefix), **options)
+    stats['rotated_out'] = rotate_snapshots(dest_dir, prefix, keep)
+    return stats
+
+
+def schedule_backups(src_path, dest_dir, interval=3600, keep=24, **options):
+    """Start an in-process PeriodicTask that snapshots every `interval` seconds"""
+    return PeriodicTask(
+        interval, lambda: snapshot(src_path, dest_dir, keep=keep, **options), name="db-backup"
+    ).start()
+
+
+def print_stats(stats):
+    print(f"✅ Backup written to {stats['path']}")
+    print(f"   {stats['pages']} pages ({stats['bytes'] / 1024:.0f} KB) in "
+          f"{stats['duration_seconds']}s - {stats['pages_per_second']} pages/s")
+    if stats['single_step_fallback']:
+        print("   ⚠️ Source was too busy for a stepwise copy; finished in one step")
+    for path in stats['rotated_out']:
+        print(f"   🗑️ Rotated out {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backup of users.db")
+    parser.add_argument('--db', default='users.db', help="database to back up (default: users.db)")
+    parser.add_argument('--dest-dir', default='backups')
+    parser.add_argument('--keep', type=int, default=24, help="snapshots to keep (default: 24)")
+    parser.add_argument('--pages', type=int, default=64, help="pages copied per step")
+    parser.add_argument('--sleep', type=float, default=0.005, help="seconds between steps")
+    parser.add_argument('--every', type=float, help="repeat every N seconds instead of once")
+    args = parser.parse_args()
+
+    options = {'pages': args.pages, 'sleep': args.sleep}
+    while True:
+        try:
+            print_stats(snapshot(args.db, args.dest_dir, keep=args.keep, **options))
+        except Exception as e:
+            print(f"❌ Backup failed: {e}")
+            if not args.every:
+                raise SystemExit(1)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
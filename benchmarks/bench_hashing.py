@@ -0,0 +1,78 @@
+"""Login throughput at each password-hashing cost setting
+
+Drives AuthDB.login_user from many threads against a temporary database
+for every (cost setting, worker pool size) pair and reports logins per
+second. Pick the strongest setting whose throughput still covers your
+peak login rate, and a pool size close to the number of cores.
+
+Usage: python benchmarks/bench_hashing.py [--seconds 3] [--clients 32] [--workers 1,2,4]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from auth_db import AuthDB
+from password_hashing import PasswordHasher
+
+COST_SETTINGS = [
+    ("pbkdf2 100k", {"algorithm": "pbkdf2_sha256", "pbkdf2_iterations": 100_000}),
+    ("pbkdf2 600k", {"algorithm": "pbkdf2_sha256", "pbkdf2_iterations": 600_000}),
+    ("scrypt n=2^13", {"algorithm": "scrypt", "scrypt_n": 2 ** 13}),
+    ("scrypt n=2^14", {"algorithm": "scrypt", "scrypt_n": 2 ** 14}),
+    ("scrypt n=2^15", {"algorithm": "scrypt", "scrypt_n": 2 ** 15}),
+]
+
+
+def run(db, usernames, clients, seconds):
+    """Hammer login_user from `clients` threads; return logins per second"""
+    stop = time.perf_counter() + seconds
+    counts = [0] * clients
+
+    def client(idx):
+        name = usernames[idx % len(usernames)]
+        while time.perf_counter() < stop:
+            ok, _ = db.login_user(name, "password123")
+            assert ok, f"login failed for {name}"
+            counts[idx] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--workers', default=f"1,2,{os.cpu_count() or 1}")
+    args = parser.parse_args()
+    pool_sizes = sorted({int(w) for w in args.workers.split(',')})
+
+    print(f"{os.cpu_count()} cores, {args.clients} concurrent clients, {args.seconds}s per run\n")
+    print(f"{'setting':<16}" + "".join(f"{f'{w} workers':>14}" for w in pool_sizes))
+
+    for label, params in COST_SETTINGS:
+        row = f"{label:<16}"
+        for workers in pool_sizes:
+            hasher = PasswordHasher(max_workers=workers, **params)
+            with tempfile.TemporaryDirectory() as tmp:
+                db = AuthDB(os.path.join(tmp, 'bench_users.db'), hasher=hasher, throttle=False)
+                usernames = [f"user{i}" for i in range(args.clients)]
+                for name in usernames:
+                    db.register_user(name, f"{name}@example.com", "password123")
+                row += f"{run(db, usernames, args.clients, args.seconds):>10.1f} /s "
+                db.close()
+            hasher.shutdown()
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
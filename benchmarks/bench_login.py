@@ -0,0 +1,109 @@
+"""Per-login database latency: legacy connect + SELECT + UPDATE vs pooled AuthDB
+
+Password hashing is set to a single PBKDF2 round here so the numbers
+show database cost only; see bench_hashing.py for KDF throughput.
+
+Usage: python benchmarks/bench_login.py [--users 1000] [--logins 5000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from auth_db import AuthDB
+from password_hashing import PasswordHasher, legacy_hash
+
+
+def legacy_login(db_path, username, password):
+    """Login as it was done before pooling: fresh connection, two statements"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, username, email, created_at
+        FROM users
+        WHERE username = ? AND password_hash = ?
+    ''', (username, legacy_hash(password)))
+    user = cursor.fetchone()
+    if user:
+        cursor.execute('''
+            UPDATE users
+            SET last_login = ?
+            WHERE username = ?
+        ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), username))
+        conn.commit()
+    conn.close()
+    return user is not None
+
+
+def measure(fn, usernames, logins):
+    """Run fn(username) for random users and return per-call latencies in ms"""
+    timings = []
+    for _ in range(logins):
+        username = random.choice(usernames)
+        start = time.perf_counter()
+        ok = fn(username)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert ok, f"login failed for {username}"
+    return timings
+
+
+def summarize(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{name:<32} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--logins', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench_users.db')
+        hasher = PasswordHasher(algorithm="pbkdf2_sha256", pbkdf2_iterations=1)
+        db = AuthDB(db_path, hasher=hasher, throttle=False)
+        usernames = [f"user{i}" for i in range(args.users)]
+        for name in usernames:
+            db.register_user(name, f"{name}@example.com", "password123")
+
+        # The legacy path compares unsalted SHA-256 hashes in SQL
+        legacy_path = os.path.join(tmp, 'bench_legacy.db')
+        AuthDB(legacy_path, hasher=hasher)
+        conn = sqlite3.connect(legacy_path)
+        conn.executemany('''
+            INSERT INTO users (username, email, password_hash, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', [(name, f"{name}@example.com", legacy_hash("password123"), "2026-01-01 00:00:00")
+              for name in usernames])
+        conn.commit()
+        conn.close()
+
+        print(f"{args.logins} logins against {args.users} users\n")
+        legacy = summarize("legacy (connect+SELECT+UPDATE)", measure(
+            lambda u: legacy_login(legacy_path, u, "password123"),
+            usernames, args.logins))
+        current = summarize("AuthDB.login_user", measure(
+            lambda u: db.login_user(u, "password123")[0],
+            usernames, args.logins))
+
+        buffered_db = AuthDB(db_path, write_behind=True, hasher=hasher, throttle=False)
+        buffered = summarize("AuthDB.login_user (write-behind)", measure(
+            lambda u: buffered_db.login_user(u, "password123")[0],
+            usernames, args.logins))
+        buffered_db.close()
+
+        print(f"\nPer-login latency reduced by {(1 - current / legacy) * 100:.1f}% "
+              f"({(1 - buffered / legacy) * 100:.1f}% with write-behind)")
+
+
+if __name__ == "__main__":
+    main()
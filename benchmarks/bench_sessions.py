@@ -0,0 +1,343 @@
+"""Multi-session load benchmark for the Streamlit pages
+
+Starts the app with `streamlit run` and drives it with headless clients
+that speak Streamlit's websocket protocol, one thread per simulated
+student: log in on Home.py, generate a study plan, send chat messages
+(free-form plus a canned button), then add and complete a task on the
+Dashboard. Gemini is the local stand-in (fake_gemini.py) and the user
+database and response cache live in a temporary directory, removed
+afterwards, so nothing leaves the machine.
+
+For each session count it prints rerun latency percentiles per step
+(request sent -> script finished, including any st.rerun), server memory
+per session (RSS growth while the sessions are connected) and
+throughput, e.g.:
+
+    python benchmarks/bench_sessions.py --sessions 1,5,10,20
+    python benchmarks/bench_sessions.py --sessions 10 --latency lognormal:1.0,0.5 --token-rate 40
+    python benchmarks/bench_sessions.py --base-url http://127.0.0.1:8089/v1beta --json report.json
+
+streamlit.testing's AppTest isn't used: it swaps process-wide globals
+for each run, so it can't run sessions concurrently.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+import requests
+from websockets.sync.client import connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+
+PASSWORD = "password123"
+FINISHED_EARLY_FOR_RERUN = 2
+
+# Which WidgetState field carries each widget type's value
+VALUE_FIELDS = {
+    'text_input': 'string_value',
+    'text_area': 'string_value',
+    'checkbox': 'bool_value',
+    'button': 'trigger_value',
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return round(sorted_values[index], 3)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_rss_kb(pid):
+    """Resident memory of the server process (Linux)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+class HeadlessSession:
+    """One browser tab, as far as the Streamlit server can tell
+
+    Keeps the widgets of the last run so flows can set them by label,
+    and a `page` -> page_script_hash map from the navigation message.
+    """
+
+    def __init__(self, ws, timeout):
+        self.ws = ws
+        self.timeout = timeout
+        self.pages = {}
+        self.page_hash = ""
+        self.widgets = {}
+        self.samples = []
+
+    def rerun(self, step, values=None, page=None):
+        """Send a rerun with widget values {widget_id: value}; wait for it to finish"""
+        if page is not None:
+            self.page_hash = self.pages[page]
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_hash
+        for widget_id, (kind, value) in (values or {}).items():
+            state = msg.rerun_script.widget_states.widgets.add()
+            state.id = widget_id
+            setattr(state, VALUE_FIELDS[kind], value)
+
+        start = time.perf_counter()
+        self.ws.send(msg.SerializeToString())
+        widgets, errors = {}, []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=self.timeout))
+            kind = fwd.WhichOneof("type")
+            if kind == "navigation":
+                for page_info in fwd.navigation.app_pages:
+                    name = page_info.url_pathname or "home"
+                    self.pages[name] = page_info.page_script_hash
+                self.page_hash = fwd.navigation.page_script_hash
+            elif kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    errors.append(element.exception.message)
+                elif element_type in VALUE_FIELDS:
+                    widget = getattr(element, element_type)
+                    widgets[widget.label] = (widget.id, element_type)
+            elif kind == "script_finished":
+                if fwd.script_finished != FINISHED_EARLY_FOR_RERUN:
+                    break
+                # st.rerun(): the follow-up run replaces this one's widgets
+                widgets = {}
+        self.samples.append((step, time.perf_counter() - start))
+        self.widgets = widgets
+        if errors:
+            raise RuntimeError(f"{step}: {errors[0]}")
+
+    def set(self, label, value, values=None):
+        """Add the widget labelled `label` (substring match) to a values dict"""
+        values = {} if values is None else values
+        for widget_label, (widget_id, kind) in self.widgets.items():
+            if label in widget_label:
+                values[widget_id] = (kind, value)
+                return values
+        raise LookupError(f"No widget labelled {label!r}")
+
+
+def run_flow(session, username, chats):
+    """Log in, make a plan, chat, then add and complete a task"""
+    session.rerun('load:home')
+    values = session.set("Username", username)
+    session.set("Password", PASSWORD, values)
+    session.set("Login", True, values)
+    session.rerun('login', values)
+    if "Logout" not in " ".join(session.widgets):
+        raise RuntimeError("login failed")
+
+    session.rerun('load:planner', page=next(p for p in session.pages if "Study_Planner" in p))
+    values = session.set("Your Name", username)
+    session.set("Subjects to Cover", "Mathematics, Physics, Chemistry", values)
+    session.set("Generate Study Plan", True, values)
+    session.rerun('plan', values)
+
+    session.rerun('load:chat', page=next(p for p in session.pages if "Chat" in p))
+    for i in range(chats):
+        values = session.set("Your message", f"How should I revise topic {i} before exams?")
+        session.set("Send Message", True, values)
+        session.rerun('chat', values)
+    session.rerun('chat_canned', session.set("Create Timetable", True))
+
+    session.rerun('load:dashboard', page=next(p for p in session.pages if "Dashboard" in p))
+    values = session.set("Task Title", "Finish chapter 5")
+    session.set("Add Task", True, values)
+    session.rerun('add_task', values)
+    session.rerun('complete_task', session.set("✓", True))
+    if "Clear Completed Tasks" not in " ".join(session.widgets):
+        raise RuntimeError("task not completed")
+
+
+def run_level(count, config):
+    """Run `count` sessions at once; returns the report for this level"""
+    sessions = [None] * count
+    errors = []
+    start_line = threading.Barrier(count)
+    rss_before = server_rss_kb(config['pid'])
+
+    with ExitStack() as connections:
+        def drive(i):
+            start_line.wait()
+            try:
+                ws = connections.enter_context(connect(
+                    config['ws_url'], subprotocols=["streamlit"], max_size=None, open_timeout=config['timeout'],
+                ))
+                sessions[i] = HeadlessSession(ws, config['timeout'])
+                run_flow(sessions[i], f"student{i}", config['chats'])
+            except Exception as e:
+                errors.append(f"student{i}: {e}")
+
+        threads = [threading.Thread(target=drive, args=(i,), name=f"session-{i}") for i in range(count)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        # Measured while every session is still connected
+        rss_after = server_rss_kb(config['pid'])
+
+    samples = [sample for s in sessions if s is not None for sample in s.samples]
+    steps = {}
+    for name, seconds in samples:
+        steps.setdefault(name, []).append(seconds)
+    report = {
+        'sessions': count,
+        'elapsed_s': round(elapsed, 2),
+        'reruns_per_s': round(len(samples) / elapsed, 2),
+        'flows_per_min': round(60 * (count - len(errors)) / elapsed, 1),
+        'server_rss_mb': round(rss_after / 1024, 1) if rss_after else None,
+        'memory_per_session_kb': round((rss_after - rss_before) / count, 1) if rss_after and rss_before else None,
+        'errors': errors,
+        'steps': {},
+    }
+    for name, values in sorted(steps.items()):
+        values.sort()
+        report['steps'][name] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+        }
+    return report
+
+
+def print_level(report):
+    memory = report['memory_per_session_kb']
+    print(f"\n👥 {report['sessions']} sessions: {report['elapsed_s']}s, "
+          f"{report['reruns_per_s']} reruns/s, {report['flows_per_min']} flows/min"
+          + (f", server {report['server_rss_mb']} MiB (+{memory} KiB/session)" if memory is not None else ""))
+    print(f"   {'step':<16}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for name, row in report['steps'].items():
+        print(f"   {name:<16}{row['count']:>7}{row['p50']:>9}{row['p95']:>9}{row['p99']:>9}")
+    for error in report['errors'][:5]:
+        print(f"   ❌ {error}")
+
+
+def start_app(workdir, env, port):
+    """`streamlit run Home.py` in workdir; returns the process once healthy"""
+    os.makedirs(os.path.join(workdir, '.streamlit'), exist_ok=True)
+    with open(os.path.join(workdir, '.streamlit', 'secrets.toml'), 'w') as f:
+        f.write('GEMINI_API_KEY = "bench"\n')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', os.path.join(ROOT, 'Home.py'),
+         '--server.headless', 'true', '--server.port', str(port),
+         '--server.fileWatcherType', 'none', '--browser.gatherUsageStats', 'false'],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).ok:
+                return process
+        except requests.exceptions.ConnectionError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.5)
+    process.kill()
+    raise SystemExit("❌ Streamlit did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', default="1,5,10", help="comma-separated session counts (default: 1,5,10)")
+    parser.add_argument('--chats', type=int, default=2, help="free-form chat messages per session")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument('--base-url', help="use an already running stand-in instead of starting one")
+    parser.add_argument('--latency', default='lognormal:0.6,0.4', help="stand-in time to first token")
+    parser.add_argument('--token-rate', type=float, default=200, help="stand-in tokens per second")
+    parser.add_argument('--reply-tokens', type=int, default=300)
+    parser.add_argument('--rpm', type=float, default=100000,
+                        help="app's Gemini quota (default: high enough not to throttle)")
+    parser.add_argument('--json', help="also write the full report to this file")
+    args = parser.parse_args()
+    levels = [int(n) for n in args.sessions.split(",")]
+
+    # Everything the app writes goes to a scratch directory
+    workdir = tempfile.mkdtemp(prefix="bench_sessions_")
+    server = None
+    base_url = args.base_url
+    from user_quota import LIMIT_ENV
+    if base_url is None:
+        from fake_gemini import StandinSettings, serve_in_background
+        server = serve_in_background(StandinSettings(
+            latency=args.latency, token_rate=args.token_rate, reply_tokens=args.reply_tokens,
+        ))
+        base_url = server.base_url
+    env = dict(os.environ, AUTH_DATABASE_URL=os.path.join(workdir, 'users.db'),
+               GEMINI_BASE_URL=base_url, GEMINI_RPM=str(args.rpm))
+    # Measure the pages, not per-user limits: every user quota is off, and
+    # so is the login throttle, since all sessions log in from one client
+    env.update(dict.fromkeys(LIMIT_ENV.values(), "0"))
+    env['AUTH_LOGIN_THROTTLE'] = "0"
+
+    reports = []
+    try:
+        from auth_db import AuthDB
+        db = AuthDB(env['AUTH_DATABASE_URL'], throttle=False, token_sweep_interval=0)
+        print(f"🧪 Gemini at {base_url}, data in {workdir}")
+        print(f"📝 Registering {max(levels)} users...")
+        for i in range(max(levels)):
+            db.register_user(f"student{i}", f"student{i}@example.com", PASSWORD)
+        db.close()
+
+        port = free_port()
+        app = start_app(workdir, env, port)
+        config = {'ws_url': f"ws://127.0.0.1:{port}/_stcore/stream", 'pid': app.pid,
+                  'chats': args.chats, 'timeout': args.timeout}
+        try:
+            # One untimed flow so imports and first-run caches don't count
+            run_level(1, config)
+            for count in levels:
+                report = run_level(count, config)
+                print_level(report)
+                reports.append(report)
+        finally:
+            app.terminate()
+            app.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            stand_in = server.snapshot()
+            server.shutdown()
+
+    result = {'config': vars(args), 'levels': reports}
+    if server is not None:
+        result['stand_in'] = stand_in
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Run the auth database against a real PostgreSQL server
+
+Creates a scratch database on the server, applies the migrations, walks
+through register, login, password reset, bulk import and export, then
+hammers a small pool from many threads so pool exhaustion, row locks
+and serialization failures go through the Postgres retry path. The
+scratch database is dropped afterwards.
+
+Point it at a server you can create databases on, or let it start a
+throwaway local one (needs `pip install pgserver`, which bundles the
+Postgres binaries):
+
+Usage:
+    python check_postgres.py --dsn postgresql://postgres@localhost/postgres
+    python check_postgres.py --start
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+from auth_db import AuthDB, POSTGRES_MIGRATIONS
+from db_pool import POOL_EXHAUSTED
+
+THREADS = 16
+
+
+def start_local_server():
+    """Start a throwaway Postgres; returns (admin dsn, stop function)"""
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("❌ --start needs pgserver: pip install pgserver (or pass --dsn)")
+    data_dir = tempfile.mkdtemp(prefix="auth_check_pg_")
+    server = pgserver.get_server(data_dir, cleanup_mode='stop')
+
+    def stop():
+        server.cleanup()
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return server.get_uri(), stop
+
+
+def with_database(dsn, name):
+    """The same server URL pointing at another database"""
+    parts = urlsplit(dsn)
+    return urlunsplit((parts.scheme, parts.netloc, f"/{name}", parts.query, parts.fragment))
+
+
+def admin_execute(dsn, sql):
+    """Run CREATE/DROP DATABASE, which can't run inside a transaction"""
+    try:
+        import psycopg2
+    except ImportError:
+        raise SystemExit("❌ Needs psycopg2: pip install psycopg2-binary") from None
+    conn = psycopg2.connect(dsn, connect_timeout=5)
+    try:
+        conn.autocommit = True
+        conn.cursor().execute(sql)
+    finally:
+        conn.close()
+
+
+class Checks:
+    """Counts passed/failed expectations and prints each one"""
+
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, label, ok, detail=""):
+        print(f"{'✅' if ok else '❌'} {label}" + (f" ({detail})" if detail and not ok else ""))
+        if not ok:
+            self.failed += 1
+
+
+def run_checks(dsn, checks):
+    db = AuthDB(dsn, pool_size=2, throttle=False, token_sweep_interval=0)
+    try:
+        checks.expect("migrations applied", db.schema_version() == POSTGRES_MIGRATIONS[-1][0],
+                      f"schema_version={db.schema_version()}")
+        # A second process starting up must skip what is already applied
+        AuthDB(dsn, pool_size=1, throttle=False, token_sweep_interval=0).close()
+        checks.expect("migrations are idempotent", db.schema_version() == POSTGRES_MIGRATIONS[-1][0])
+
+        ok, message = db.register_user("alice", "alice@example.com", "password123")
+        checks.expect("register", ok, message)
+        ok, message = db.register_user("alice", "other@example.com", "password123")
+        checks.expect("duplicate username rejected", not ok and "Username" in message, message)
+        ok, message = db.register_user("alice2", "alice@example.com", "password123")
+        checks.expect("duplicate email rejected", not ok and "Email" in message, message)
+
+        ok, info = db.login_user("alice", "password123")
+        checks.expect("login", ok and info['username'] == "alice", info)
+        checks.expect("wrong password rejected", not db.login_user("alice", "nope")[0])
+        checks.expect("last_login stamped", bool(db.get_user_info("alice")['last_login']))
+
+        ok, token = db.generate_reset_token("alice@example.com")
+        checks.expect("reset token issued", ok, token)
+        if ok:
+            checks.expect("reset token verified",
+                          db.verify_reset_token("alice@example.com", token['reset_token'])[0])
+            checks.expect("password reset", db.reset_password("alice@example.com", "newpass456")[0])
+            checks.expect("old password rejected after reset", not db.login_user("alice", "password123")[0])
+            checks.expect("new password accepted", db.login_user("alice", "newpass456")[0])
+        checks.expect("expired token purge runs", db.purge_expired_reset_tokens() >= 0)
+
+        rows = [{'username': f"bulk{i}", 'email': f"bulk{i}@example.com", 'password': "password123"}
+                for i in range(50)]
+        results = db.bulk_register(rows)
+        checks.expect("bulk register", all(ok for ok, _ in results),
+                      [message for ok, message in results if not ok][:3])
+        exported = list(db.iter_users(batch_size=7))
+        checks.expect("export streams every user", len(exported) == 51, f"{len(exported)} users")
+
+        # Two connections, many threads: waits for the pool and for row locks
+        with ThreadPoolExecutor(THREADS) as pool:
+            logins = list(pool.map(lambda i: db.login_user(f"bulk{i % 50}", "password123"), range(200)))
+        errors = [info for ok, info in logins if not ok]
+        checks.expect(f"{len(logins)} concurrent logins on a 2-connection pool", not errors, errors[:3])
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            resets = list(pool.map(lambda i: db.reset_password("bulk0@example.com", f"password{i:03d}"),
+                                   range(40)))
+        errors = [message for ok, message in resets if not ok]
+        checks.expect("concurrent resets of one row", not errors, errors[:3])
+
+        psycopg2 = db.backend._psycopg2
+        retryable = db.backend.is_busy_error
+        checks.expect("pool exhaustion is retryable", retryable(psycopg2.OperationalError(POOL_EXHAUSTED)))
+        checks.expect("serialization failures are retryable",
+                      retryable(psycopg2.errors.SerializationFailure()))
+        checks.expect("other errors are not retried", not retryable(psycopg2.OperationalError("server closed")))
+        print(f"   retry stats: {db.retry.stats()}")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check AuthDB against a PostgreSQL server")
+    parser.add_argument('--dsn', default=os.environ.get("AUTH_CHECK_DSN"),
+                        help="admin connection URL; a scratch database is created on that server")
+    parser.add_argument('--start', action='store_true', help="start a throwaway local server (pgserver)")
+    parser.add_argument('--keep', action='store_true', help="don't drop the scratch database")
+    args = parser.parse_args()
+    if not args.dsn and not args.start:
+        parser.error("pass --dsn or --start")
+
+    stop = None
+    admin_dsn = args.dsn
+    if args.start:
+        admin_dsn, stop = start_local_server()
+        print(f"🐘 Local Postgres at {admin_dsn}")
+
+    name = f"auth_check_{uuid.uuid4().hex[:8]}"
+    checks = Checks()
+    try:
+        admin_execute(admin_dsn, f"CREATE DATABASE {name}")
+        try:
+            run_checks(with_database(admin_dsn, name), checks)
+        finally:
+            if args.keep:
+                print(f"📦 Kept database {name}")
+            else:
+                admin_execute(admin_dsn, f"DROP DATABASE {name} WITH (FORCE)")
+    finally:
+        if stop is not None:
+            stop()
+
+    if checks.failed:
+        print(f"\n❌ {checks.failed} check(s) failed")
+        sys.exit(1)
+    print("\n🎉 All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Pragmas applied to every pooled connection. WAL lets readers keep going
+# while a writer holds the lock, and NORMAL sync is safe under WAL.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -8000,        # ~8 MB page cache per connection
+    "mmap_size": 64 * 1024 * 1024,
+    "foreign_keys": "ON",
+}
+
+
+POOL_EXHAUSTED = "connection pool exhausted"
+
+
+class ConnectionPool:
+    """Bounded pool of reusable SQLite connections for one database file
+
+    Subclasses can pool other DB-API connections by overriding _connect,
+    _reset and Error.
+    """
+
+    # Errors meaning a connection is in an unknown state
+    Error = sqlite3.Error
+
+    def __init__(self, db_path, max_size=8, busy_timeout_ms=5000, pragmas=None):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        """Open a new connection and apply pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _check_fork(self):
+        """Drop inherited connections if we are running in a forked child"""
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._idle = queue.LifoQueue(maxsize=self.max_size)
+                    self._created = 0
+                    self._pid = os.getpid()
+
+    def acquire(self, timeout=None):
+        """Take a connection from the pool, opening one if below max_size"""
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        wait = self.busy_timeout_ms / 1000 if timeout is None else timeout
+        try:
+            return self._idle.get(timeout=wait)
+        except queue.Empty:
+            raise self._exhausted()
+
+    def _exhausted(self):
+        """Error raised when no connection frees up in time"""
+        return sqlite3.OperationalError(POOL_EXHAUSTED)
+
+    def _reset(self, conn):
+        """End any transaction left open before the connection is reused"""
+        if conn.in_transaction:
+            conn.rollback()
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        self._reset(conn)
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def discard(self, conn):
+        """Close a broken connection instead of returning it"""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """Context manager yielding a pooled connection"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            try:
+                self.release(conn)
+            except self.Error:
+                # Rollback failed, so the connection state is unknown
+                self.discard(conn)
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+def is_busy_error(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED style errors worth retrying"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class RetryPolicy:
+    """Retries busy/locked SQLite errors with jittered exponential backoff
+
+    Attempts continue until `deadline` seconds have passed since the first
+    one. Counters are kept so contention can be watched in production.
+    `retryable` decides which errors are worth another attempt.
+    """
+
+    def __init__(self, deadline=10.0, base_delay=0.01, max_delay=0.5, retryable=is_busy_error):
+        self.deadline = deadline
+        self.retryable = retryable
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.lock_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def run(self, fn):
+        """Call fn() until it succeeds, raises a non-busy error or times out"""
+        start = time.monotonic()
+        attempt = 0
+        with self._lock:
+            self.calls += 1
+        while True:
+            attempt_start = time.monotonic()
+            try:
+                return fn()
+            except Exception as e:
+                if not self.retryable(e):
+                    raise
+                now = time.monotonic()
+                # Time spent inside the failed attempt was spent waiting
+                # on busy_timeout, so it counts as lock wait too
+                waited = now - attempt_start
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                if now + delay - start > self.deadline:
+                    with self._lock:
+                        self.failures += 1
+                        self.lock_wait_seconds += waited
+                    raise
+                with self._lock:
+                    self.retries += 1
+                    self.lock_wait_seconds += waited + delay
+                time.sleep(delay)
+                attempt += 1
+
+    def stats(self):
+        """Contention counters since startup"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'lock_wait_seconds': round(self.lock_wait_seconds, 3),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, **kwargs):
+    """Get the process-wide pool for a database path"""
+    key = (os.getpid(), os.path.abspath(db_path))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path, **kwargs)
+                _pools[key] = pool
+    return pool
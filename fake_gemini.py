@@ -0,0 +1,328 @@
+"""Local stand-in for the Gemini API, for offline testing and load benchmarks
+
+Implements the three endpoints the app uses - models list,
+generateContent and streamGenerateContent (SSE) - with the same response
+shapes as the real API, plus knobs for what makes the real thing hard
+to test against: latency, token rate, quota 429s, injected 5xx, SAFETY
+and MAX_TOKENS finishes.
+
+Point the app at it with GEMINI_BASE_URL (any API key is accepted):
+
+    python fake_gemini.py --port 8089 --latency lognormal:0.8,0.5 --token-rate 40
+    GEMINI_BASE_URL=http://127.0.0.1:8089/v1beta streamlit run Home.py
+
+Latency specs (seconds to first token): "0.5", "uniform:0.2,1.0",
+"lognormal:<median>,<sigma>" or "exp:<mean>".
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from rate_limit import TokenBucketLimiter
+
+MODELS = [
+    ("gemini-flash-latest", "Gemini Flash Latest"),
+    ("gemini-2.5-flash", "Gemini 2.5 Flash"),
+    ("gemini-2.5-pro", "Gemini 2.5 Pro"),
+]
+
+ROUTE = re.compile(r"^/v1(?:beta)?/models(?:/([^:/]+)(?::(\w+))?)?$")
+
+WORDS = (
+    "study revise practice focus schedule break notes chapter concept exam "
+    "goal review recall problem topic plan minutes daily weekly memory test "
+    "understand apply summary example session priority progress"
+).split()
+
+
+def parse_latency(spec, rng):
+    """Sampler returning seconds for a latency spec (see module docstring)"""
+    kind, _, args = spec.partition(":")
+    if not args:
+        value = float(kind)
+        return lambda: value
+    params = [float(a) for a in args.split(",")]
+    if kind == "uniform":
+        return lambda: rng.uniform(*params)
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda: rng.lognormvariate(math.log(median), sigma)
+    if kind == "exp":
+        return lambda: rng.expovariate(1 / params[0])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class StandinSettings:
+    """Behaviour of the stand-in; rates are per-request probabilities"""
+
+    def __init__(self, latency="lognormal:0.6,0.4", token_rate=60.0, reply_tokens=300, chunk_tokens=8,
+                 error_429=0.0, error_5xx=0.0, safety=0.0, max_tokens=0.0, rpm=None,
+                 retry_delay=2, responses=None, seed=None):
+        self.rng = random.Random(seed)
+        self.latency_spec = latency
+        self.first_token = parse_latency(latency, self.rng)
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.chunk_tokens = chunk_tokens
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.safety = safety
+        self.max_tokens = max_tokens
+        self.retry_delay = retry_delay
+        # Optional quota: past `rpm` requests per minute every call gets a real 429
+        self.quota = TokenBucketLimiter(capacity=rpm, refill_per_sec=rpm / 60) if rpm else None
+        # Substring -> reply text; "*" is the fallback
+        self.responses = responses or {}
+
+    def outcome(self):
+        """What this request should do: 'quota', '429', '5xx', 'safety', 'max_tokens' or 'ok'"""
+        if self.quota is not None and not self.quota.try_acquire("quota")[0]:
+            return "quota"
+        draw = self.rng.random()
+        for name, rate in (("429", self.error_429), ("5xx", self.error_5xx),
+                           ("safety", self.safety), ("max_tokens", self.max_tokens)):
+            if draw < rate:
+                return name
+            draw -= rate
+        return "ok"
+
+    def reply_for(self, prompt):
+        """Canned reply for the prompt, or filler text seeded by it"""
+        for needle, text in self.responses.items():
+            if needle != "*" and needle in prompt:
+                return text
+        if "*" in self.responses:
+            return self.responses["*"]
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        words = []
+        for i in range(self.reply_tokens):
+            word = rng.choice(WORDS)
+            words.append(word + ("." if i % 12 == 11 else ""))
+        return "## Study Plan\n\n" + " ".join(words)
+
+
+def count_tokens(text):
+    # Close enough to Gemini's tokenizer for load testing
+    return len(text.split())
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    # ─── Helpers ───────────────────────────────────────────────────
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(f"http_{status}")
+
+    def _send_error(self, code, status, message, details=None):
+        error = {"code": code, "message": message, "status": status}
+        if details:
+            error["details"] = details
+        self._send_json(code, {"error": error})
+
+    def _send_event(self, payload):
+        data = b"data: " + json.dumps(payload).encode("utf-8") + b"\r\n\r\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    # ─── Routes ────────────────────────────────────────────────────
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/_stats":
+            return self._send_json(200, self.server.snapshot())
+        match = ROUTE.match(path)
+        if not match or match.group(2):
+            return self._send_error(404, "NOT_FOUND", f"Unknown path {path}")
+        if not self.headers.get("x-goog-api-key"):
+            return self._send_error(403, "PERMISSION_DENIED", "Method doesn't allow unregistered callers.")
+        models = [self.server.model_info(name, display) for name, display in MODELS]
+        if match.group(1):
+            found = [m for m in models if m["name"] == f"models/{match.group(1)}"]
+            if not found:
+                return self._send_error(404, "NOT_FOUND", f"models/{match.group(1)} is not found")
+            return self._send_json(200, found[0])
+        self._send_json(200, {"models": models})
+
+    def do_POST(self):
+        split = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        match = ROUTE.match(split.path)
+        method = match.group(2) if match else None
+        if method not in ("generateContent", "streamGenerateContent"):
+            return self._send_error(404, "NOT_FOUND", f"Unknown path {split.path}")
+        if not self.headers.get("x-goog-api-key"):
+            return self._send_error(403, "PERMISSION_DENIED", "Method doesn't allow unregistered callers.")
+        try:
+            request = json.loads(body)
+            prompt = "".join(part.get("text", "") for content in request["contents"]
+                             for part in content.get("parts", []))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self._send_error(400, "INVALID_ARGUMENT", "Invalid JSON payload received.")
+
+        settings = self.server.settings
+        outcome = settings.outcome()
+        self.server.count(outcome)
+        if outcome in ("quota", "429"):
+            return self._send_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).", [{
+                "@type": "type.googleapis.com/google.rpc.RetryInfo",
+                "retryDelay": f"{settings.retry_delay}s",
+            }])
+        if outcome == "5xx":
+            time.sleep(settings.first_token())
+            return self._send_error(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+
+        tokens = [] if outcome == "safety" else settings.reply_for(prompt).split(" ")
+        finish_reason = "SAFETY" if outcome == "safety" else "STOP"
+        limit = (request.get("generationConfig") or {}).get("maxOutputTokens")
+        if outcome == "max_tokens":
+            limit = min(limit or len(tokens), max(1, len(tokens) // 2))
+        if limit and len(tokens) > limit:
+            tokens, finish_reason = tokens[:limit], "MAX_TOKENS"
+        usage = {"promptTokenCount": count_tokens(prompt)}
+
+        time.sleep(settings.first_token())
+        if method == "generateContent":
+            time.sleep(len(tokens) / settings.token_rate)
+            usage["candidatesTokenCount"] = len(tokens)
+            usage["totalTokenCount"] = usage["promptTokenCount"] + len(tokens)
+            candidate = {"finishReason": finish_reason, "index": 0}
+            if tokens:
+                candidate["content"] = {"parts": [{"text": " ".join(tokens)}], "role": "model"}
+            return self._send_json(200, {"candidates": [candidate], "usageMetadata": usage,
+                                         "modelVersion": match.group(1)})
+        self._stream(tokens, finish_reason, usage, match.group(1))
+
+    def _stream(self, tokens, finish_reason, usage, model):
+        settings = self.server.settings
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.server.count("http_200")
+        step = settings.chunk_tokens
+        chunks = [tokens[i:i + step] for i in range(0, len(tokens), step)] or [[]]
+        try:
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(len(chunk) / settings.token_rate)
+                candidate = {"index": 0}
+                if chunk:
+                    # Keep the separating space so joined chunks read normally
+                    text = " ".join(chunk) + (" " if i < len(chunks) - 1 else "")
+                    candidate["content"] = {"parts": [{"text": text}], "role": "model"}
+                event = {"candidates": [candidate], "modelVersion": model}
+                if i == len(chunks) - 1:
+                    candidate["finishReason"] = finish_reason
+                    usage["candidatesTokenCount"] = len(tokens)
+                    usage["totalTokenCount"] = usage["promptTokenCount"] + len(tokens)
+                    event["usageMetadata"] = usage
+                self._send_event(event)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count("disconnected")
+            self.close_connection = True
+
+
+class StandinServer(ThreadingHTTPServer):
+    """HTTP server holding the settings and request counters"""
+
+    daemon_threads = True
+
+    def __init__(self, address, settings=None, verbose=False):
+        super().__init__(address, StandinHandler)
+        self.settings = settings or StandinSettings()
+        self.verbose = verbose
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def count(self, what):
+        """Bump a counter: an outcome ('ok', 'safety', ...) or 'http_<status>'"""
+        with self._stats_lock:
+            self.stats[what] = self.stats.get(what, 0) + 1
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    @staticmethod
+    def model_info(name, display_name):
+        return {
+            "name": f"models/{name}",
+            "displayName": display_name,
+            "inputTokenLimit": 1048576,
+            "outputTokenLimit": 65536,
+            "supportedGenerationMethods": ["generateContent", "streamGenerateContent", "countTokens"],
+        }
+
+
+def serve_in_background(settings=None, host="127.0.0.1", port=0):
+    """Start a stand-in on a daemon thread; returns the server (see .base_url)"""
+    server = StandinServer((host, port), settings)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='lognormal:0.6,0.4', help="time to first token (default: lognormal:0.6,0.4)")
+    parser.add_argument('--token-rate', type=float, default=60, help="tokens per second (default: 60)")
+    parser.add_argument('--reply-tokens', type=int, default=300, help="length of generated replies")
+    parser.add_argument('--chunk-tokens', type=int, default=8, help="tokens per SSE event")
+    parser.add_argument('--error-429', type=float, default=0.0, help="fraction of requests answered 429")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument('--safety', type=float, default=0.0, help="fraction blocked with finishReason SAFETY")
+    parser.add_argument('--max-tokens', type=float, default=0.0, help="fraction cut short with MAX_TOKENS")
+    parser.add_argument('--rpm', type=float, help="emulate a requests-per-minute quota")
+    parser.add_argument('--responses', help="JSON file mapping prompt substrings to replies ('*' = default)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+    settings = StandinSettings(
+        latency=args.latency, token_rate=args.token_rate, reply_tokens=args.reply_tokens,
+        chunk_tokens=args.chunk_tokens, error_429=args.error_429, error_5xx=args.error_5xx,
+        safety=args.safety, max_tokens=args.max_tokens, rpm=args.rpm, responses=responses, seed=args.seed,
+    )
+    server = StandinServer((args.host, args.port), settings, verbose=args.verbose)
+    print(f"🧪 Gemini stand-in on {server.base_url}")
+    print(f"   Run the app with: GEMINI_BASE_URL={server.base_url} streamlit run Home.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {server.snapshot()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,649 @@
+"""Shared Gemini API client
+
+Every page (and the diagnostic scripts) goes through one process-wide
+requests.Session, so calls reuse pooled keep-alive connections instead
+of paying a TCP+TLS handshake each time. The parts of the request body
+that never change (safety settings, generation config) are serialized
+once; only the prompt is encoded per call.
+
+stream() yields the reply as it is generated (streamGenerateContent
+over server-sent events), so pages can show the first words right away.
+
+Calls made with cached=True (canned prompts) go through the shared
+ResponseCache first, and successful replies are stored there. Identical
+requests already in flight are joined rather than sent again (see
+single_flight.py).
+
+Requests to Gemini are admitted by the process-wide RequestScheduler
+(request_scheduler.py): a token bucket sized to the quota with priority
+lanes. Callers pass a lane and an on_queue(position, eta) callback to
+show users where they are in line; 429s are waited out and retried.
+
+Timeouts, connection errors and 5xx responses are retried with jittered
+backoff within a retry budget, and a circuit breaker fails calls fast
+while Gemini keeps failing (see resilience.py). With hedge=True, a call
+still waiting past the observed p95 latency gets a second copy sent and
+the first answer wins.
+
+generate() and stream() record latency, time to first byte, queue wait,
+token counts, finishReason, status and retries for each upstream call,
+labelled by the caller's page and prompt type (see telemetry.py).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from request_scheduler import QueueFull, QueueTimeout, RequestAbandoned, get_scheduler, retry_after_seconds
+from resilience import CircuitBreaker, CircuitOpen, LatencyTracker, RetryBudget, backoff_delay
+from response_cache import get_response_cache, make_key
+from single_flight import FlightCancelled, FlightTimeout, SingleFlight
+from telemetry import CallRecord, metrics, start_file_export
+
+logger = logging.getLogger(__name__)
+
+# Set GEMINI_BASE_URL to point at a local stand-in (see fake_gemini.py)
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+DEFAULT_MODEL = "gemini-flash-latest"
+REQUEST_TIMEOUT = 45
+MAX_RETRIES = 2
+RETRYABLE_STATUS = {500, 502, 503, 504}
+# Hedge copies in flight at once; past this, slow calls just wait
+HEDGE_WORKERS = 16
+
+SAFETY_SETTINGS = [
+    {"category": category, "threshold": "BLOCK_NONE"}
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+    )
+]
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "topK": 40,
+    "topP": 0.95,
+    "maxOutputTokens": 2048,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_connections=2, pool_maxsize=32):
+    """The process-wide HTTP session (pool sizes apply on first call)
+
+    pool_maxsize bounds the keep-alive connections kept per host; every
+    Streamlit session runs in its own thread, so size it for the number
+    of concurrent Gemini calls you expect.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({"Content-Type": "application/json"})
+                _session = session
+    return _session
+
+
+class StreamResult:
+    """How a stream() call ended; pass one in as `result` to find out
+
+    `status` is the HTTP status, "cached" for a cache hit, or a label
+    such as "timeout" or "queue_full" when no answer came back. `ok` is
+    only true for a complete reply (finishReason STOP or a cache hit),
+    so a page can tell a real answer from a message chunk without
+    reading the text. Token counts come from Gemini's usageMetadata.
+    """
+
+    # Statuses of calls that never got as far as Gemini
+    NOT_SENT = ("cached", "queue_full", "circuit_open", "cancelled")
+
+    def __init__(self):
+        self.ok = False
+        self.status = None
+        self.finish_reason = None
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    @property
+    def reached_api(self):
+        return self.status is not None and self.status not in self.NOT_SENT
+
+    def update(self, other):
+        self.__dict__.update(other.__dict__)
+
+
+class GeminiClient:
+    """generateContent calls for one API key and model over the shared session"""
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=GEMINI_BASE_URL,
+                 timeout=REQUEST_TIMEOUT, session=None, cache=None, flights=None, scheduler=None,
+                 max_retries=MAX_RETRIES, hedge=False):
+        self.api_key = api_key
+        self.cache = cache
+        self.flights = flights or SingleFlight()
+        self.scheduler = scheduler or get_scheduler()
+        self.max_retries = max_retries
+        self.retry_budget = RetryBudget()
+        self.breaker = CircuitBreaker()
+        self.hedge = hedge
+        self.hedged = 0
+        self._hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="gemini-hedge") if hedge else None
+        self._hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = session or get_session()
+        # Key in a header rather than the URL, so it stays out of logs
+        self.headers = {"x-goog-api-key": api_key}
+        self.generate_url = f"{self.base_url}/models/{model}:generateContent"
+        self.stream_url = f"{self.base_url}/models/{model}:streamGenerateContent?alt=sse"
+        # Time to response headers, per endpoint; drives the hedge delay
+        self.latency = {self.generate_url: LatencyTracker(), self.stream_url: LatencyTracker()}
+        self._body_suffix = self._encode_suffix(GENERATION_CONFIG)
+
+    @staticmethod
+    def _encode_suffix(generation_config):
+        """Serialized tail of the request body: everything after the prompt"""
+        tail = json.dumps({"safetySettings": SAFETY_SETTINGS, "generationConfig": generation_config})
+        return ("}]}]," + tail[1:]).encode("utf-8")
+
+    def build_body(self, prompt, generation_config=None):
+        """JSON request body for prompt, reusing the prebuilt template"""
+        suffix = self._body_suffix if generation_config is None else self._encode_suffix(generation_config)
+        return b'{"contents": [{"parts": [{"text": ' + json.dumps(prompt).encode("utf-8") + suffix
+
+    def cache_key(self, prompt, generation_config=None):
+        """Response cache key for this prompt on this client's model"""
+        return make_key(prompt, self.model, GENERATION_CONFIG if generation_config is None else generation_config)
+
+    def _cache_key_for(self, prompt, generation_config, cached):
+        if cached and self.cache is not None:
+            return self.cache_key(prompt, generation_config)
+        return None
+
+    @property
+    def wait_timeout(self):
+        """Default wait for a shared result: long enough for every retry"""
+        return self.timeout * (self.max_retries + 1)
+
+    def _send(self, url, body, lane, on_wait=None, stream=False, call=None, abandoned=None):
+        """POST through the breaker and scheduler with retries; returns the last response
+
+        429s are waited out by the scheduler. Timeouts, connection errors
+        and 5xx are retried with backoff while the retry budget allows;
+        the final failure is raised or returned. With stream=True only the
+        wait for headers is covered - a stream that breaks midway is not
+        resent. Queue wait and retries are added to `call`, if given.
+        Once abandoned() is true, nothing more is sent and
+        RequestAbandoned is raised.
+        """
+        call = call or CallRecord()
+        self.retry_budget.deposit()
+        throttles = retries = 0
+        while True:
+            call.retries = throttles + retries
+            if abandoned is not None and abandoned():
+                raise RequestAbandoned()
+            self.breaker.check()
+            queued_at = time.perf_counter()
+            self.scheduler.acquire(lane, on_wait, abandoned)
+            call.queue_seconds += time.perf_counter() - queued_at
+            # A half-open probe is claimed only once it is really sent, and
+            # handed back on any exit without a verdict (429s, other errors)
+            probe = self.breaker.begin()
+            try:
+                try:
+                    response = self._post(url, body, stream)
+                except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                    self.breaker.record_failure()
+                    if retries >= self.max_retries or not self.retry_budget.withdraw():
+                        raise
+                else:
+                    if response.status_code == 429:
+                        if throttles >= self.scheduler.max_retries:
+                            return response
+                        throttles += 1
+                        self.scheduler.throttled(retry_after_seconds(response))
+                        response.close()
+                        continue
+                    if response.status_code not in RETRYABLE_STATUS:
+                        self.breaker.record_success()
+                        self.scheduler.succeeded()
+                        return response
+                    self.breaker.record_failure()
+                    if retries >= self.max_retries or not self.retry_budget.withdraw():
+                        return response
+                    response.close()
+            finally:
+                self.breaker.release(probe)
+            time.sleep(backoff_delay(retries))
+            retries += 1
+
+    def _post(self, url, body, stream=False):
+        """One POST; hedged with a second copy if it runs past the recent p95"""
+        latency = self.latency[url]
+
+        def post():
+            start = time.perf_counter()
+            response = self.session.post(url, data=body, headers=self.headers, timeout=self.timeout, stream=stream)
+            latency.add(time.perf_counter() - start)
+            return response
+
+        hedge_after = latency.percentile(0.95) if self.hedge else None
+        if hedge_after is None:
+            return post()
+
+        # The primary gets a thread of its own, so it is sent right away
+        # and hedge_after counts from the real send; only copies use the pool
+        primary = Future()
+
+        def send_primary():
+            primary.set_running_or_notify_cancel()
+            try:
+                primary.set_result(post())
+            except BaseException as e:
+                primary.set_exception(e)
+        threading.Thread(target=send_primary, name="gemini-primary", daemon=True).start()
+        done, _ = wait([primary], timeout=hedge_after)
+        # Hedges need a free worker, spare quota and budget, never a place in a queue
+        if done or not self._hedge_slots.acquire(blocking=False):
+            return primary.result()
+        if not self.retry_budget.withdraw() or not self.scheduler.try_acquire():
+            self._hedge_slots.release()
+            return primary.result()
+        self.hedged += 1
+        hedge = self._hedge_pool.submit(post)
+        hedge.add_done_callback(lambda f: self._hedge_slots.release())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = done.pop()
+            if winner.exception() is None or not pending:
+                break
+        for loser in pending:
+            # Close the slower response whenever it arrives
+            loser.add_done_callback(lambda f: f.exception() is None and f.result().close())
+        return winner.result()
+
+    def post_generate(self, prompt, generation_config=None, lane="interactive", on_wait=None):
+        """Send one generateContent request; returns the raw response"""
+        return self._send(self.generate_url, self.build_body(prompt, generation_config), lane, on_wait)
+
+    def list_models(self):
+        """All models visible to this key"""
+        response = self.session.get(f"{self.base_url}/models", headers=self.headers, timeout=10)
+        response.raise_for_status()
+        return response.json().get("models", [])
+
+    @staticmethod
+    def no_text_message(finish_reason):
+        """User-facing message for a reply that came back without text"""
+        # Check if blocked by safety
+        if finish_reason == 'SAFETY':
+            return "⚠️ Response blocked by safety filters. Please rephrase your request."
+        elif finish_reason == 'RECITATION':
+            return "⚠️ Response blocked due to recitation. Please try a different query."
+        return "⚠️ Unable to generate response. Please try again with different wording."
+
+    @staticmethod
+    def reply_text(data):
+        """Text of the first candidate in a response body, or None"""
+        # Check if response has candidates
+        if 'candidates' in data and len(data['candidates']) > 0:
+            candidate = data['candidates'][0]
+
+            # Check for content
+            if 'content' in candidate and 'parts' in candidate['content']:
+                return candidate['content']['parts'][0].get('text') or None
+        return None
+
+    @staticmethod
+    def finish_reason(data):
+        candidates = data.get('candidates') or []
+        return candidates[0].get('finishReason') if candidates else None
+
+    @staticmethod
+    def error_message(response):
+        """User-facing message for a non-200 response"""
+        if response.status_code == 429:
+            return "⚠️ API rate limit reached. Please wait a moment and try again."
+        elif response.status_code == 403:
+            return "⚠️ API access denied. This might be due to quota limits or API key issues. Please try again later or check your API configuration."
+        elif response.status_code == 400:
+            error_data = response.json()
+            error_msg = error_data.get('error', {}).get('message', 'Invalid request')
+            return f"⚠️ Invalid request: {error_msg}. Please try rephrasing your question."
+        return f"⚠️ API Error {response.status_code}. Please try again."
+
+    def generate(self, prompt, generation_config=None, cached=False, wait_timeout=None, cancel=None,
+                 lane="interactive", on_queue=None, page="unknown", prompt_type="unknown"):
+        """Call Gemini API with given prompt and proper error handling
+
+        Identical calls already in flight are shared. `wait_timeout`
+        (default: long enough for every retry) bounds the wait for a shared
+        result; if the optional `cancel` event is set, returns None.
+        While queued, on_queue(position, eta_seconds) is called from
+        this thread; (0, 0) means the request has been sent. `page` and
+        `prompt_type` label the call's metrics.
+        """
+        key = self._cache_key_for(prompt, generation_config, cached)
+        if key is not None:
+            text = self._cache_lookup(key, page, prompt_type)
+            if text is not None:
+                return text
+
+        try:
+            return self.flights.do(
+                ("generate", self.cache_key(prompt, generation_config)),
+                lambda set_status, abandoned: self._generate_upstream(
+                    prompt, generation_config, key, lane, set_status, abandoned,
+                    CallRecord(page, prompt_type, "generate")
+                ),
+                timeout=self.wait_timeout if wait_timeout is None else wait_timeout,
+                cancel=cancel,
+                on_status=self._status_callback(on_queue),
+            )
+        except FlightTimeout:
+            return self.exception_message(requests.exceptions.Timeout())
+        except FlightCancelled:
+            return None
+
+    def _cache_lookup(self, key, page, prompt_type):
+        """Cached reply or None; a failed read (locked, pool exhausted) counts as a miss"""
+        try:
+            text = self.cache.get(key)
+        except Exception as e:
+            metrics.inc('gemini_cache_read_errors_total')
+            logger.warning("Could not read Gemini reply cache: %s", e)
+            text = None
+        result = 'miss' if text is None else 'hit'
+        metrics.inc('gemini_cache_requests_total', (('page', page), ('prompt_type', prompt_type), ('result', result)))
+        return text
+
+    def _cache_store(self, key, text):
+        """Cache a reply; a failed write (locked or full disk) is logged, never shown"""
+        try:
+            self.cache.set(key, text, model=self.model)
+        except Exception as e:
+            metrics.inc('gemini_cache_write_errors_total')
+            logger.warning("Could not cache Gemini reply: %s", e)
+
+    @staticmethod
+    def _status_callback(on_queue):
+        if on_queue is None:
+            return None
+        return lambda status: on_queue(*status)
+
+    @staticmethod
+    def _queue_reporter(set_status):
+        return lambda position, eta: set_status((position, eta))
+
+    def _generate_upstream(self, prompt, generation_config, key, lane, set_status, abandoned, call):
+        start = time.perf_counter()
+        try:
+            response = self._send(self.generate_url, self.build_body(prompt, generation_config), lane,
+                                  self._queue_reporter(set_status), call=call, abandoned=abandoned)
+            call.ttfb = time.perf_counter() - start
+            call.status = response.status_code
+            if response.status_code != 200:
+                return self.error_message(response)
+
+            data = response.json()
+            call.use_usage(data)
+            call.finish_reason = self.finish_reason(data)
+            text = self.reply_text(data)
+            if text is None:
+                return self.no_text_message(call.finish_reason)
+            # Only finished replies are cached, never errors or truncated text
+            if key is not None and call.finish_reason == "STOP":
+                self._cache_store(key, text)
+            return text
+
+        except Exception as e:
+            call.status = self.error_status(e)
+            return self.exception_message(e)
+        finally:
+            call.record(metrics, time.perf_counter() - start)
+
+    @staticmethod
+    def error_status(error):
+        """Status label for a call that raised instead of answering"""
+        if isinstance(error, (QueueFull, QueueTimeout)):
+            return "queue_full"
+        elif isinstance(error, RequestAbandoned):
+            return "cancelled"
+        elif isinstance(error, CircuitOpen):
+            return "circuit_open"
+        elif isinstance(error, requests.exceptions.Timeout):
+            return "timeout"
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            return "connection_error"
+        return "error"
+
+    @staticmethod
+    def exception_message(error):
+        """User-facing message for a failed request"""
+        if isinstance(error, (QueueFull, QueueTimeout)):
+            return "⚠️ Too many requests are waiting right now. Please try again in a minute."
+        elif isinstance(error, CircuitOpen):
+            return "⚠️ The AI service is having trouble right now. Please try again in a minute."
+        elif isinstance(error, requests.exceptions.Timeout):
+            return "⚠️ Request timed out. Please try again."
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            return "⚠️ Connection error. Please check your internet connection."
+        return f"⚠️ Unexpected error: {str(error)}. Please try again."
+
+    def stream(self, prompt, generation_config=None, cached=False, wait_timeout=None, cancel=None,
+               lane="interactive", on_queue=None, page="unknown", prompt_type="unknown", result=None):
+        """Yield reply text chunks as Gemini generates them
+
+        Failures come through as a user-facing message chunk, the same
+        text generate() would return, so callers can simply join chunks.
+        A cache hit comes back as one chunk. Identical streams already in
+        flight are shared; `wait_timeout` bounds the wait for each next
+        chunk, and setting the optional `cancel` event (or closing the
+        generator) stops following it. If a StreamResult is passed as
+        `result`, it says how the call ended once the stream is done. The
+        other options work as in generate().
+        """
+        result = StreamResult() if result is None else result
+        key = self._cache_key_for(prompt, generation_config, cached)
+        if key is not None:
+            text = self._cache_lookup(key, page, prompt_type)
+            if text is not None:
+                result.ok, result.status = True, "cached"
+                yield text
+                return
+
+        emitted = False
+        try:
+            for chunk in self.flights.stream(
+                ("stream", self.cache_key(prompt, generation_config)),
+                lambda set_status, abandoned: self._stream_upstream(
+                    prompt, generation_config, key, lane, set_status, abandoned,
+                    CallRecord(page, prompt_type, "stream")
+                ),
+                timeout=self.wait_timeout if wait_timeout is None else wait_timeout,
+                cancel=cancel,
+                on_status=self._status_callback(on_queue),
+            ):
+                # The upstream call ends with its StreamResult
+                if isinstance(chunk, StreamResult):
+                    result.update(chunk)
+                    continue
+                emitted = True
+                yield chunk
+        except FlightTimeout:
+            result.ok, result.status = False, "timeout"
+            yield ("\n\n" if emitted else "") + self.exception_message(requests.exceptions.Timeout())
+        except FlightCancelled:
+            result.ok, result.status = False, "cancelled"
+            return
+
+    def _stream_upstream(self, prompt, generation_config, key, lane, set_status, abandoned, call):
+        """One streamGenerateContent call, yielding text or a message chunk,
+        then a StreamResult"""
+        start = time.perf_counter()
+        emitted = False
+        complete = False
+        pieces = []
+        try:
+            with self._send(
+                self.stream_url,
+                self.build_body(prompt, generation_config),
+                lane,
+                self._queue_reporter(set_status),
+                stream=True,
+                call=call,
+                abandoned=abandoned,
+            ) as response:
+                call.status = response.status_code
+                if response.status_code != 200:
+                    yield self.error_message(response)
+                else:
+                    finish_reason = None
+                    # chunk_size=None hands over data as it arrives instead
+                    # of waiting for a full buffer
+                    for line in response.iter_lines(chunk_size=None):
+                        # Each SSE event is one "data: {...}" line holding a
+                        # partial GenerateContentResponse
+                        if not line.startswith(b"data:"):
+                            continue
+                        data = json.loads(line[5:].decode("utf-8"))
+                        # The last event carries the totals
+                        call.use_usage(data)
+                        candidates = data.get('candidates') or []
+                        if not candidates:
+                            continue
+                        candidate = candidates[0]
+                        for part in candidate.get('content', {}).get('parts', []):
+                            text = part.get('text')
+                            if text:
+                                if not emitted:
+                                    call.ttfb = time.perf_counter() - start
+                                emitted = True
+                                pieces.append(text)
+                                yield text
+                        finish_reason = candidate.get('finishReason') or finish_reason
+
+                    call.finish_reason = finish_reason
+                    complete = emitted and finish_reason == "STOP"
+                    if not emitted:
+                        yield self.no_text_message(finish_reason)
+                    elif finish_reason is None:
+                        # The stream closed without saying the reply was finished
+                        yield "\n\n⚠️ The reply ended early. Please try again."
+                    elif complete and key is not None:
+                        # A cut-short reply would come back from the cache as complete
+                        self._cache_store(key, "".join(pieces))
+
+        except Exception as e:
+            # requests reports a read timeout mid-stream as a ConnectionError
+            if isinstance(e, requests.exceptions.ConnectionError) and "timed out" in str(e).lower():
+                e = requests.exceptions.Timeout(e)
+            call.status = self.error_status(e)
+            complete = False
+            # Keep whatever already arrived and say why it stopped
+            yield ("\n\n" if emitted else "") + self.exception_message(e)
+        finally:
+            call.record(metrics, time.perf_counter() - start)
+
+        result = StreamResult()
+        result.ok = complete
+        result.status = call.status
+        result.finish_reason = call.finish_reason or None
+        result.prompt_tokens = call.prompt_tokens
+        result.output_tokens = call.output_tokens
+        yield result
+
+    def gauges(self):
+        """Point-in-time state of this client, for the metrics export"""
+        labels = (('model', self.model),)
+        flights = self.flights.stats()
+        breaker_state = {'closed': 0, 'half_open': 1, 'open': 2}[self.breaker.state]
+        return [
+            ('gemini_circuit_state', "0 closed, 1 half-open, 2 open", labels, breaker_state),
+            ('gemini_in_flight', "Distinct upstream calls in progress", labels, flights['in_flight']),
+            ('gemini_coalesced', "Calls that joined an identical one in flight", labels, flights['coalesced']),
+            ('gemini_hedged', "Hedged second copies sent", labels, self.hedged),
+            ('gemini_retry_budget', "Retry/hedge tokens available", labels, round(self.retry_budget.balance, 2)),
+        ]
+
+
+def collect_stream(chunks, on_update):
+    """Join streamed chunks, calling on_update(text_so_far) after each one
+
+    Returns the full text, e.g. to save in session history once the
+    stream ends.
+    """
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        on_update(text)
+    return text
+
+
+def queue_message(position, eta):
+    """User-facing note for an on_queue(position, eta) update"""
+    if position == 0:
+        return "🤖 Your turn - generating..."
+    return f"⏳ Lots of students are asking right now. You're #{position} in line (about {eta}s)."
+
+
+def shared_gauges():
+    """Process-wide state for the metrics export: response cache and scheduler"""
+    cache = get_response_cache().stats()
+    scheduler = get_scheduler().stats()
+    gauges = [
+        ('gemini_cache_hit_ratio', "Share of cache lookups served from either tier", (), round(cache['hit_ratio'], 4)),
+        ('gemini_cache_hits', "Cache hits since start", (('tier', 'memory'),), cache['memory_hits']),
+        ('gemini_cache_hits', "Cache hits since start", (('tier', 'disk'),), cache['disk_hits']),
+        ('gemini_cache_misses', "Cache misses since start", (), cache['misses']),
+        ('gemini_cache_entries', "Cached replies", (('tier', 'memory'),), cache['memory_size']),
+        ('gemini_cache_entries', "Cached replies", (('tier', 'disk'),), cache['disk_size']),
+        ('gemini_scheduler_throttled', "429s answered by Gemini since start", (), scheduler['throttled']),
+        ('gemini_scheduler_rejected', "Requests turned away by a full queue", (), scheduler['rejected']),
+    ]
+    for lane, waiting in scheduler['waiting'].items():
+        gauges.append(('gemini_scheduler_waiting', "Requests queued for quota", (('lane', lane),), waiting))
+    return gauges
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, model=DEFAULT_MODEL):
+    """Get the shared GeminiClient for an API key and model
+
+    Hedged requests are enabled with GEMINI_HEDGE=1. Shared clients
+    report to the process-wide metrics (telemetry.py).
+    """
+    key = (api_key, model)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                if not _clients:
+                    metrics.add_collector(shared_gauges)
+                    start_file_export()
+                client = _clients[key] = GeminiClient(
+                    api_key, model=model, cache=get_response_cache(),
+                    hedge=os.environ.get("GEMINI_HEDGE", "") == "1",
+                )
+                metrics.add_collector(client.gauges)
+    return client
@@ -0,0 +1,134 @@
+"""Bulk import/export of users in users.db
+
+Import streams a CSV or JSONL file in chunks, so 100k-row cohorts never
+sit in memory. Each chunk is inserted with one executemany transaction
+after its passwords are hashed in parallel. Rows that clash with an
+existing username or email are reported by line number and skipped.
+
+Usage:
+    python manage_users.py import cohort.csv [--chunk-size 1000] [--workers 8]
+    python manage_users.py export users.jsonl [--with-hashes]
+
+Import columns: username, email, and password or password_hash
+(created_at is optional). The format is taken from the file extension
+(.csv or .jsonl) unless --format is given.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from auth_db import AuthDB
+from password_hashing import PasswordHasher
+
+EXPORT_FIELDS = ['id', 'username', 'email', 'created_at', 'last_login']
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    if path.endswith('.csv'):
+        return 'csv'
+    if path.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    sys.exit(f"❌ Can't tell the format of {path}; pass --format csv or --format jsonl")
+
+
+def read_rows(f, fmt):
+    """Yield (line_number, row_dict) without loading the whole file"""
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, {}
+
+
+def import_users(db, path, fmt, chunk_size):
+    imported = failed = 0
+    start = time.perf_counter()
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = read_rows(f, fmt)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            results = db.bulk_register([row for _, row in chunk])
+            for (line_number, _), (success, message) in zip(chunk, results):
+                if success:
+                    imported += 1
+                else:
+                    failed += 1
+                    print(f"line {line_number}: {message}", file=sys.stderr)
+            elapsed = time.perf_counter() - start
+            print(f"  ... {imported + failed} rows processed ({imported / elapsed:.0f} users/s)")
+
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Imported {imported} users, {failed} rejected, in {elapsed:.1f}s")
+    return failed == 0
+
+
+def export_users(db, path, fmt, with_hashes):
+    fields = EXPORT_FIELDS + (['password_hash'] if with_hashes else [])
+    count = 0
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+        for user in db.iter_users(include_hashes=with_hashes):
+            if fmt == 'csv':
+                writer.writerow(user)
+            else:
+                f.write(json.dumps(user) + '\n')
+            count += 1
+
+    print(f"✅ Exported {count} users to {path}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export of users in users.db")
+    parser.add_argument('--db', default='users.db', help="database path (default: users.db)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_import = sub.add_parser('import', help="import users from CSV/JSONL")
+    p_import.add_argument('path')
+    p_import.add_argument('--format', choices=['csv', 'jsonl'])
+    p_import.add_argument('--chunk-size', type=int, default=1000)
+    p_import.add_argument('--workers', type=int, default=None,
+                          help="password hashing threads (default: up to 4)")
+
+    p_export = sub.add_parser('export', help="export users to CSV/JSONL")
+    p_export.add_argument('path')
+    p_export.add_argument('--format', choices=['csv', 'jsonl'])
+    p_export.add_argument('--with-hashes', action='store_true',
+                          help="include password hashes so the file can be re-imported")
+
+    args = parser.parse_args()
+    workers = getattr(args, 'workers', None)
+    db = AuthDB(args.db, hasher=PasswordHasher(max_workers=workers))
+    fmt = detect_format(args.path, args.format)
+
+    try:
+        if args.command == 'import':
+            ok = import_users(db, args.path, fmt, args.chunk_size)
+        else:
+            ok = export_users(db, args.path, fmt, args.with_hashes)
+    finally:
+        db.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,10 @@
 import streamlit as st
-import requests
 from datetime import datetime, timedelta
 import sys
 sys.path.append('..')
-from auth import require_auth, get_current_user, logout
+from auth import require_auth, get_current_user, get_usage_key, logout
+from gemini_client import GENERATION_CONFIG, StreamResult, get_client, collect_stream, queue_message
+from user_quota import get_user_quota
 
 # Import API key - try Streamlit secrets first (for deployment), then config file (for local)
 try:
@@ -35,86 +36,8 @@ with st.sidebar:
         st.rerun()
 
 # ─── Gemini API Config ─────────────────────────────────────────
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
-
-def call_gemini_api(prompt):
-    """Call Gemini API with given prompt and proper error handling"""
-    try:
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt}
-                    ]
-                }
-            ],
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 2048
-            }
-        }
-        
-        response = requests.post(GEMINI_API_URL, json=payload, timeout=45)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check if response has candidates
-            if 'candidates' in data and len(data['candidates']) > 0:
-                candidate = data['candidates'][0]
-                
-                # Check for content
-                if 'content' in candidate and 'parts' in candidate['content']:
-                    text = candidate['content']['parts'][0].get('text', '')
-                    if text:
-                        return text
-                
-                # Check if blocked by safety
-                if 'finishReason' in candidate:
-                    if candidate['finishReason'] == 'SAFETY':
-                        return "⚠️ Response blocked by safety filters. Please rephrase your request."
-                    elif candidate['finishReason'] == 'RECITATION':
-                        return "⚠️ Response blocked due to recitation. Please try a different query."
-            
-            return "⚠️ Unable to generate response. Please try again with different wording."
-            
-        elif response.status_code == 429:
-            return "⚠️ API rate limit reached. Please wait a moment and try again."
-        elif response.status_code == 403:
-            return "⚠️ API access denied. This might be due to quota limits or API key issues. Please try again later or check your API configuration."
-        elif response.status_code == 400:
-            error_data = response.json()
-            error_msg = error_data.get('error', {}).get('message', 'Invalid request')
-            return f"⚠️ Invalid request: {error_msg}. Please try rephrasing your question."
-        else:
-            return f"⚠️ API Error {response.status_code}. Please try again."
-            
-    except requests.exceptions.Timeout:
-        return "⚠️ Request timed out. Please try again."
-    except requests.exceptions.ConnectionError:
-        return "⚠️ Connection error. Please check your internet connection."
-    except Exception as e:
-        return f"⚠️ Unexpected error: {str(e)}. Please try again."
+# One pooled client per process, shared by every page and session
+stream_gemini_api = get_client(GEMINI_API_KEY).stream
 
 # ─── Custom CSS ────────────────────────────────────────────────
 st.markdown("""
@@ -231,8 +154,16 @@ with st.form("study_plan_form"):
 
 # ─── Generate Plan ─────────────────────────────────────────────
 if submitted:
+    quota = get_user_quota()
+    decision = None
+    if name and subjects:
+        # Per-user limits are checked before anything reaches Gemini
+        decision = quota.admit(get_usage_key(), GENERATION_CONFIG["maxOutputTokens"])
+    
     if not name or not subjects:
         st.error("❌ Please fill in your name and subjects!")
+    elif not decision.allowed:
+        st.warning(decision.message)
     else:
         # Calculate days until exam
         days_until_exam = (exam_date - datetime.now().date()).days
@@ -262,13 +193,40 @@ Generate a comprehensive study plan that includes:
 
 Format the plan in a clear, organized way with proper sections and bullet points."""
 
-        # Show loading
-        with st.spinner("🤖 AI is creating your personalized study plan..."):
-            plan = call_gemini_api(prompt)
+        # Show the plan as it is written
+        st.markdown("---")
+        st.markdown("## 📋 Your Personalized Study Plan")
+        plan_slot = st.empty()
+        plan_slot.info("🤖 AI is creating your personalized study plan...")
+        # Shorter plans when close to the token limit; asking for a short
+        # plan lets it finish instead of being cut off mid-section
+        config = None
+        if decision.degraded:
+            config = dict(GENERATION_CONFIG, maxOutputTokens=decision.max_output_tokens)
+            prompt += (f"\n\nKeep the whole plan under {decision.max_output_tokens * 3 // 5} words: "
+                       "a short week-by-week breakdown and daily schedule only.")
+        result = StreamResult()
+        plan = collect_stream(
+            # Plans queue behind interactive chat when the quota is tight
+            stream_gemini_api(prompt, config, lane="plan",
+                              on_queue=lambda position, eta: plan_slot.info(queue_message(position, eta)),
+                              page="planner", prompt_type="study_plan", result=result),
+            lambda text: plan_slot.markdown(text + "▌")
+        )
+        # Only tokens Gemini reports are charged; unsent calls are refunded
+        quota.settle(get_usage_key(), result.reached_api, result.prompt_tokens + result.output_tokens)
         
-        # Display result
-        if plan and not plan.startswith("Error"):
-            st.success("✅ Your study plan is ready!")
+        # Display result; a plan cut off at the length limit is still
+        # kept (it was paid for), marked as shortened
+        if result.ok or result.finish_reason == "MAX_TOKENS":
+            plan_slot.markdown(plan)
+            shortened = not result.ok
+            if not shortened:
+                st.success("✅ Your study plan is ready!")
+            elif decision.degraded:
+                st.warning("⚠️ You're close to your AI usage limit, so this plan was kept short and its end is cut off.")
+            else:
+                st.warning("⚠️ This plan hit the length limit and its end is cut off. Try fewer subjects for a complete plan.")
             
             # Save to session state
             if 'study_plans' not in st.session_state:
@@ -280,13 +238,10 @@ Format the plan in a clear, organized way with proper sections and bullet points
                 'subjects': subjects,
                 'exam_date': exam_date,
                 'plan': plan,
+                'shortened': shortened,
                 'created_at': datetime.now()
             })
             
-            st.markdown("---")
-            st.markdown("## 📋 Your Personalized Study Plan")
-            st.markdown(plan)
-            
             # Download button
             st.download_button(
                 label="📥 Download Plan",
@@ -295,6 +250,7 @@ Format the plan in a clear, organized way with proper sections and bullet points
                 mime="text/plain"
             )
         else:
+            plan_slot.empty()
             st.error(f"❌ Failed to generate plan: {plan}")
 
 # ─── Previous Plans ────────────────────────────────────────────
@@ -307,5 +263,7 @@ if 'study_plans' in st.session_state and st.session_state.study_plans:
             st.markdown(f"**Created:** {plan['created_at'].strftime('%Y-%m-%d %H:%M')}")
             st.markdown(f"**Exam Date:** {plan['exam_date']}")
             st.markdown(f"**Subjects:** {plan['subjects']}")
+            if plan.get('shortened'):
+                st.caption("⚠️ Cut short at the length limit")
             st.markdown("---")
             st.markdown(plan['plan'])
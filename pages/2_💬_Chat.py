@@ -1,9 +1,11 @@
 import streamlit as st
-import requests
 from datetime import datetime
 import sys
 sys.path.append('..')
-from auth import require_auth, get_current_user, logout
+from auth import require_auth, get_current_user, get_usage_key, logout
+from gemini_client import GENERATION_CONFIG, StreamResult, get_client, collect_stream, queue_message
+from user_quota import get_user_quota
+import prompts
 
 # Import API key - try Streamlit secrets first (for deployment), then config file (for local)
 try:
@@ -35,86 +37,57 @@ with st.sidebar:
         st.rerun()
 
 # ─── Gemini API Config ─────────────────────────────────────────
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
+# One pooled client per process, shared by every page and session
+stream_gemini_api = get_client(GEMINI_API_KEY).stream
+quota = get_user_quota()
 
-def call_gemini_api(prompt):
-    """Call Gemini API with given prompt and proper error handling"""
-    try:
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt}
-                    ]
-                }
-            ],
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 2048
-            }
-        }
+def stream_reply(prompt, prompt_type, cached=False):
+    """Show the latest question and stream the answer under the chat; returns the full reply
+    
+    Canned prompts pass cached=True so repeat clicks are served from the response cache.
+    prompt_type labels the call in the Gemini metrics. Every call goes
+    through the user's quota first: over it, the reply is the quota
+    message; close to it, answers are shorter.
+    """
+    with reply_slot.container():
+        st.markdown(f"""
+        <div class="user-message">
+            <strong>👤 You:</strong><br>
+            {st.session_state.chat_history[-1]['content']}
+        </div>
+        """, unsafe_allow_html=True)
+        answer = st.empty()
         
-        response = requests.post(GEMINI_API_URL, json=payload, timeout=45)
+        def show(text):
+            answer.markdown(f"""
+            <div class="bot-message">
+                <strong>🤖 AI Assistant:</strong><br>
+                {text}▌
+            </div>
+            """, unsafe_allow_html=True)
         
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check if response has candidates
-            if 'candidates' in data and len(data['candidates']) > 0:
-                candidate = data['candidates'][0]
-                
-                # Check for content
-                if 'content' in candidate and 'parts' in candidate['content']:
-                    text = candidate['content']['parts'][0].get('text', '')
-                    if text:
-                        return text
-                
-                # Check if blocked by safety
-                if 'finishReason' in candidate:
-                    if candidate['finishReason'] == 'SAFETY':
-                        return "⚠️ Response blocked by safety filters. Please rephrase your request."
-                    elif candidate['finishReason'] == 'RECITATION':
-                        return "⚠️ Response blocked due to recitation. Please try a different query."
-            
-            return "⚠️ Unable to generate response. Please try again with different wording."
-            
-        elif response.status_code == 429:
-            return "⚠️ API rate limit reached. Please wait a moment and try again."
-        elif response.status_code == 403:
-            return "⚠️ API access denied. This might be due to quota limits or API key issues. Please try again later or check your API configuration."
-        elif response.status_code == 400:
-            error_data = response.json()
-            error_msg = error_data.get('error', {}).get('message', 'Invalid request')
-            return f"⚠️ Invalid request: {error_msg}. Please try rephrasing your question."
-        else:
-            return f"⚠️ API Error {response.status_code}. Please try again."
-            
-    except requests.exceptions.Timeout:
-        return "⚠️ Request timed out. Please try again."
-    except requests.exceptions.ConnectionError:
-        return "⚠️ Connection error. Please check your internet connection."
-    except Exception as e:
-        return f"⚠️ Unexpected error: {str(e)}. Please try again."
+        # Busy periods: show the place in line instead of failing
+        def show_queue(position, eta):
+            show(queue_message(position, eta))
+        
+        usage_key = get_usage_key()
+        decision = quota.admit(usage_key, GENERATION_CONFIG["maxOutputTokens"])
+        if not decision.allowed:
+            show(decision.message)
+            return decision.message
+        config = None
+        if decision.degraded:
+            config = dict(GENERATION_CONFIG, maxOutputTokens=decision.max_output_tokens)
+        
+        result = StreamResult()
+        reply = collect_stream(
+            stream_gemini_api(prompt, config, cached=cached, lane="interactive", on_queue=show_queue,
+                              page="chat", prompt_type=prompt_type, result=result),
+            show
+        )
+        # Cache hits and calls turned away before Gemini don't count
+        quota.settle(usage_key, result.reached_api, result.prompt_tokens + result.output_tokens)
+        return reply
 
 # ─── Custom CSS ────────────────────────────────────────────────
 st.markdown("""
@@ -242,6 +215,8 @@ with col1:
                     {message['content']}
                 </div>
                 """, unsafe_allow_html=True)
+        # New replies stream in here, then move into the history on rerun
+        reply_slot = st.empty()
     
     # Chat input
     st.markdown("---")
@@ -269,17 +244,10 @@ with col1:
         })
         
         # Build context-aware prompt
-        prompt = f"""You are an AI Study Assistant helping students with their studies. 
-Previous conversation context:
-{chr(10).join([f"{msg['role']}: {msg['content']}" for msg in st.session_state.chat_history[-3:]])}
-
-Student's new question: {user_input}
-
-Provide a helpful, encouraging, and informative response. Be specific and actionable."""
+        prompt = prompts.chat_prompt(st.session_state.chat_history, user_input)
         
         # Get AI response
-        with st.spinner("🤖 AI is thinking..."):
-            response = call_gemini_api(prompt)
+        response = stream_reply(prompt, "question")
         
         # Add bot response to history
         st.session_state.chat_history.append({
@@ -302,18 +270,7 @@ with col2:
         st.session_state.selected_education_level = "Class 10th"
     
     # Education level selector
-    education_levels = [
-        "📖 Class 10th",
-        "📘 Class 12th - Science",
-        "📙 Class 12th - Commerce", 
-        "📕 Class 12th - Arts",
-        "🎓 B.Tech - Computer Science",
-        "🎓 B.Tech - Electrical/Electronics",
-        "🎓 B.Tech - Mechanical",
-        "🎓 B.Tech - Civil",
-        "💼 MBA - All Streams",
-        "🎯 Competitive Exams (JEE/NEET)"
-    ]
+    education_levels = prompts.EDUCATION_LEVELS
     
     selected_level = st.selectbox(
         "Select Your Level:",
@@ -334,20 +291,9 @@ with col2:
                 'timestamp': datetime.now()
             })
             
-            prompt = f"""You are an AI Study Assistant. Create a comprehensive daily study timetable for a {selected_level} student.
-
-Include:
-1. Optimal study hours (morning, afternoon, evening)
-2. Subject allocation with time slots
-3. Break times and duration
-4. Revision sessions
-5. Tips specific to this education level
-6. Balanced schedule for weekdays and weekends
-
-Make it practical and easy to follow!"""
+            prompt = prompts.timetable_prompt(selected_level)
             
-            with st.spinner("🤖 Creating your timetable..."):
-                response = call_gemini_api(prompt)
+            response = stream_reply(prompt, "timetable", cached=True)
             
             st.session_state.chat_history.append({
                 'role': 'bot',
@@ -365,20 +311,9 @@ Make it practical and easy to follow!"""
                 'timestamp': datetime.now()
             })
             
-            prompt = f"""You are an AI Study Assistant. Create a comprehensive study plan for a {selected_level} student.
-
-Include:
-1. Key subjects and topics to cover
-2. Week-by-week breakdown
-3. Important chapters/units priority
-4. Revision strategy
-5. Exam preparation timeline
-6. Study resources and techniques
-
-Make it detailed and motivating!"""
+            prompt = prompts.planner_prompt(selected_level)
             
-            with st.spinner("🤖 Preparing your study plan..."):
-                response = call_gemini_api(prompt)
+            response = stream_reply(prompt, "planner", cached=True)
             
             st.session_state.chat_history.append({
                 'role': 'bot',
@@ -391,28 +326,9 @@ Make it detailed and motivating!"""
     # Quick subject help
     st.markdown("#### 📚 Subject-Specific Help")
     
-    subject_help_options = {
-        "Class 10th": ["Math", "Science", "Social Studies", "English"],
-        "Class 12th": ["Physics", "Chemistry", "Math", "Biology", "Economics", "Accounts"],
-        "B.Tech": ["Programming", "Data Structures", "DBMS", "Operating Systems"],
-        "MBA": ["Marketing", "Finance", "HR", "Operations"],
-        "Competitive": ["Quantitative Aptitude", "Reasoning", "General Knowledge"]
-    }
-    
-    # Determine subject category based on selected level
-    subject_category = "Class 10th"
-    if "12th" in selected_level:
-        subject_category = "Class 12th"
-    elif "B.Tech" in selected_level:
-        subject_category = "B.Tech"
-    elif "MBA" in selected_level:
-        subject_category = "MBA"
-    elif "Competitive" in selected_level:
-        subject_category = "Competitive"
-    
-    subjects = subject_help_options.get(subject_category, ["Math", "Science", "English"])
+    subjects = prompts.subjects_for(selected_level)
     
-    for subject in subjects[:3]:  # Show first 3 subjects
+    for subject in subjects:
         if st.button(f"📖 {subject} Help", key=f"subject_{subject}", use_container_width=True):
             st.session_state.chat_history.append({
                 'role': 'user',
@@ -420,20 +336,9 @@ Make it detailed and motivating!"""
                 'timestamp': datetime.now()
             })
             
-            prompt = f"""You are an AI Study Assistant. Provide effective study strategies for {subject} specifically for {selected_level} students.
-
-Include:
-1. Key topics to focus on
-2. Best study methods for this subject
-3. Common mistakes to avoid
-4. Resource recommendations
-5. Practice tips
-6. Time management for this subject
-
-Be specific and practical!"""
+            prompt = prompts.subject_help_prompt(subject, selected_level)
             
-            with st.spinner("🤖 Preparing subject guidance..."):
-                response = call_gemini_api(prompt)
+            response = stream_reply(prompt, "subject", cached=True)
             
             st.session_state.chat_history.append({
                 'role': 'bot',
@@ -447,38 +352,7 @@ Be specific and practical!"""
     st.markdown("## �🎯 Study Categories")
     
     # Category-based recommendations
-    categories = {
-        "📚 Study Techniques": [
-            "Pomodoro Technique guide",
-            "Active recall strategies",
-            "Spaced repetition tips",
-            "Feynman technique explained"
-        ],
-        "⏰ Time Management": [
-            "Create effective timetable",
-            "Beat procrastination",
-            "Prioritize tasks",
-            "Balance study & breaks"
-        ],
-        "📝 Exam Preparation": [
-            "Last-minute revision tips",
-            "Manage exam anxiety",
-            "Practice test strategies",
-            "Improve answer writing"
-        ],
-        "💪 Motivation": [
-            "Stay motivated daily",
-            "Overcome study burnout",
-            "Set achievable goals",
-            "Build study habits"
-        ],
-        "🧠 Memory & Focus": [
-            "Boost concentration",
-            "Memory improvement tricks",
-            "Avoid distractions",
-            "Deep work techniques"
-        ]
-    }
+    categories = prompts.CATEGORIES
     
     selected_category = st.selectbox(
         "Choose a category:",
@@ -497,19 +371,9 @@ Be specific and practical!"""
             })
             
             # Enhanced prompt with category context
-            prompt = f"""You are an AI Study Assistant. A student is asking about {recommendation} from the {selected_category} category.
+            prompt = prompts.category_prompt(recommendation, selected_category)
             
-Provide detailed, practical advice with:
-1. Clear explanation
-2. Step-by-step guide
-3. Real examples
-4. Common mistakes to avoid
-5. Quick action tips
-
-Make it engaging and actionable!"""
-            
-            with st.spinner("🤖 AI is preparing recommendations..."):
-                response = call_gemini_api(prompt)
+            response = stream_reply(prompt, "category", cached=True)
             
             st.session_state.chat_history.append({
                 'role': 'bot',
@@ -522,12 +386,7 @@ Make it engaging and actionable!"""
     st.markdown("---")
     st.markdown("## 💡 Quick Topics")
     
-    quick_questions = [
-        "📝 How to make effective notes?",
-        "🧠 Best memory techniques",
-        "⏰ Create a study timetable",
-        "😴 Deal with exam stress"
-    ]
+    quick_questions = prompts.QUICK_QUESTIONS
     
     for question in quick_questions:
         if st.button(question, key=question, use_container_width=True):
@@ -537,11 +396,9 @@ Make it engaging and actionable!"""
                 'timestamp': datetime.now()
             })
             
-            prompt = f"""You are an AI Study Assistant. Answer this question with practical, actionable advice:
-{question.split(' ', 1)[1]}"""
+            prompt = prompts.quick_question_prompt(question)
             
-            with st.spinner("🤖 AI is thinking..."):
-                response = call_gemini_api(prompt)
+            response = stream_reply(prompt, "quick", cached=True)
             
             st.session_state.chat_history.append({
                 'role': 'bot',
@@ -185,16 +185,18 @@ with col_left:
                 col_check, col_task = st.columns([1, 10])
                 
                 with col_check:
-                    if st.checkbox(
+                    checked = st.checkbox(
                         "✓",
                         value=is_completed,
                         key=f"task_{idx}",
                         label_visibility="collapsed"
-                    ):
+                    )
+                    # Only rerun on a change; a checked box stays checked on every run
+                    if checked and not is_completed:
                         st.session_state.tasks[idx]['completed'] = True
                         st.session_state.tasks[idx]['completed_at'] = datetime.now().strftime('%Y-%m-%d %H:%M')
                         st.rerun()
-                    elif is_completed and not st.session_state.tasks[idx].get('completed', False):
+                    elif is_completed and not checked:
                         st.session_state.tasks[idx]['completed'] = False
                         st.rerun()
                 
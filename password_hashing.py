@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Static salt used by the original single-round SHA-256 scheme. Only kept
+# so old hashes can still be verified and upgraded on the next login.
+LEGACY_SALT = "ai_study_planner_2026"
+
+DEFAULT_SCRYPT = {"n": 2 ** 14, "r": 8, "p": 1}
+DEFAULT_PBKDF2_ITERATIONS = 600_000
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def legacy_hash(password):
+    """The original unsalted-per-user SHA-256 hash"""
+    return hashlib.sha256((password + LEGACY_SALT).encode()).hexdigest()
+
+
+class PasswordHasher:
+    """Salted KDF hashing run on a bounded pool of worker threads
+
+    hashlib's scrypt and pbkdf2_hmac release the GIL while they run, so a
+    thread pool gets real parallelism without pickling overhead. The pool
+    caps how many hashes run at once, so a burst of logins queues up
+    instead of starving the Streamlit script threads of CPU.
+
+    Encoded hashes look like:
+        scrypt$<n>$<r>$<p>$<salt>$<hash>
+        pbkdf2_sha256$<iterations>$<salt>$<hash>
+    and 64-character hex strings are treated as legacy SHA-256 hashes.
+    """
+
+    def __init__(self, algorithm="scrypt", scrypt_n=None, scrypt_r=None, scrypt_p=None,
+                 pbkdf2_iterations=DEFAULT_PBKDF2_ITERATIONS, max_workers=None, max_pending=None):
+        if algorithm not in ("scrypt", "pbkdf2_sha256"):
+            raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.scrypt_n = scrypt_n or DEFAULT_SCRYPT["n"]
+        self.scrypt_r = scrypt_r or DEFAULT_SCRYPT["r"]
+        self.scrypt_p = scrypt_p or DEFAULT_SCRYPT["p"]
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pwhash")
+        # Bound the backlog as well as the workers so callers block
+        # instead of piling up unbounded work during a login storm
+        self._slots = threading.BoundedSemaphore(max_pending or self.max_workers * 8)
+
+    # ─── KDF primitives (run on worker threads) ────────────────────
+    def _scrypt(self, password, salt, n, r, p):
+        return hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r * p + 1024 * 1024, dklen=32,
+        )
+
+    def _pbkdf2(self, password, salt, iterations):
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, dklen=32)
+
+    def _hash_sync(self, password):
+        salt = secrets.token_bytes(16)
+        if self.algorithm == "scrypt":
+            digest = self._scrypt(password, salt, self.scrypt_n, self.scrypt_r, self.scrypt_p)
+            return f"scrypt${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}${_b64encode(salt)}${_b64encode(digest)}"
+        digest = self._pbkdf2(password, salt, self.pbkdf2_iterations)
+        return f"pbkdf2_sha256${self.pbkdf2_iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def _verify_sync(self, password, encoded):
+        if "$" not in encoded:
+            return hmac.compare_digest(legacy_hash(password), encoded)
+
+        parts = encoded.split("$")
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = self._scrypt(password, _b64decode(parts[4]), n, r, p)
+            return hmac.compare_digest(digest, _b64decode(parts[5]))
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            digest = self._pbkdf2(password, _b64decode(parts[2]), int(parts[1]))
+            return hmac.compare_digest(digest, _b64decode(parts[3]))
+        return False
+
+    # ─── Public API ────────────────────────────────────────────────
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password):
+        """Hash a password with the configured KDF and a fresh salt"""
+        return self._submit(self._hash_sync, password).result()
+
+    def verify(self, password, encoded):
+        """Check a password against an encoded hash"""
+        return self._submit(self._verify_sync, password, encoded).result()
+
+    def hash_many(self, passwords):
+        """Hash several passwords in parallel, preserving order"""
+        futures = [self._submit(self._hash_sync, password) for password in passwords]
+        return [future.result() for future in futures]
+
+    def needs_upgrade(self, encoded):
+        """True if a hash was made with an old scheme or weaker settings"""
+        if "$" not in encoded:
+            return True
+        parts = encoded.split("$")
+        if self.algorithm == "scrypt":
+            return parts[0] != "scrypt" or parts[1:4] != [str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)]
+        return parts[0] != "pbkdf2_sha256" or parts[1] != str(self.pbkdf2_iterations)
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=True)
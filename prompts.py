@@ -0,0 +1,175 @@
+"""Prompt builders and canned options for the Chat page
+
+Kept out of the page so the cache warm-up job (warm_cache.py) can
+enumerate exactly the prompts the Quick Planner and Study Categories
+buttons send.
+"""
+
+EDUCATION_LEVELS = [
+    "📖 Class 10th",
+    "📘 Class 12th - Science",
+    "📙 Class 12th - Commerce",
+    "📕 Class 12th - Arts",
+    "🎓 B.Tech - Computer Science",
+    "🎓 B.Tech - Electrical/Electronics",
+    "🎓 B.Tech - Mechanical",
+    "🎓 B.Tech - Civil",
+    "💼 MBA - All Streams",
+    "🎯 Competitive Exams (JEE/NEET)"
+]
+
+SUBJECT_HELP_OPTIONS = {
+    "Class 10th": ["Math", "Science", "Social Studies", "English"],
+    "Class 12th": ["Physics", "Chemistry", "Math", "Biology", "Economics", "Accounts"],
+    "B.Tech": ["Programming", "Data Structures", "DBMS", "Operating Systems"],
+    "MBA": ["Marketing", "Finance", "HR", "Operations"],
+    "Competitive": ["Quantitative Aptitude", "Reasoning", "General Knowledge"]
+}
+
+# Subject buttons shown per level
+SUBJECT_BUTTONS = 3
+
+CATEGORIES = {
+    "📚 Study Techniques": [
+        "Pomodoro Technique guide",
+        "Active recall strategies",
+        "Spaced repetition tips",
+        "Feynman technique explained"
+    ],
+    "⏰ Time Management": [
+        "Create effective timetable",
+        "Beat procrastination",
+        "Prioritize tasks",
+        "Balance study & breaks"
+    ],
+    "📝 Exam Preparation": [
+        "Last-minute revision tips",
+        "Manage exam anxiety",
+        "Practice test strategies",
+        "Improve answer writing"
+    ],
+    "💪 Motivation": [
+        "Stay motivated daily",
+        "Overcome study burnout",
+        "Set achievable goals",
+        "Build study habits"
+    ],
+    "🧠 Memory & Focus": [
+        "Boost concentration",
+        "Memory improvement tricks",
+        "Avoid distractions",
+        "Deep work techniques"
+    ]
+}
+
+QUICK_QUESTIONS = [
+    "📝 How to make effective notes?",
+    "🧠 Best memory techniques",
+    "⏰ Create a study timetable",
+    "😴 Deal with exam stress"
+]
+
+
+def subject_category(level):
+    """Key into SUBJECT_HELP_OPTIONS for an education level"""
+    if "12th" in level:
+        return "Class 12th"
+    elif "B.Tech" in level:
+        return "B.Tech"
+    elif "MBA" in level:
+        return "MBA"
+    elif "Competitive" in level:
+        return "Competitive"
+    return "Class 10th"
+
+
+def subjects_for(level):
+    """Subjects offered as help buttons for a level"""
+    subjects = SUBJECT_HELP_OPTIONS.get(subject_category(level), ["Math", "Science", "English"])
+    return subjects[:SUBJECT_BUTTONS]
+
+
+def chat_prompt(history, user_input):
+    """Free-form question with the last few messages as context"""
+    return f"""You are an AI Study Assistant helping students with their studies.
+Previous conversation context:
+{chr(10).join([f"{msg['role']}: {msg['content']}" for msg in history[-3:]])}
+
+Student's new question: {user_input}
+
+Provide a helpful, encouraging, and informative response. Be specific and actionable."""
+
+
+def timetable_prompt(level):
+    return f"""You are an AI Study Assistant. Create a comprehensive daily study timetable for a {level} student.
+
+Include:
+1. Optimal study hours (morning, afternoon, evening)
+2. Subject allocation with time slots
+3. Break times and duration
+4. Revision sessions
+5. Tips specific to this education level
+6. Balanced schedule for weekdays and weekends
+
+Make it practical and easy to follow!"""
+
+
+def planner_prompt(level):
+    return f"""You are an AI Study Assistant. Create a comprehensive study plan for a {level} student.
+
+Include:
+1. Key subjects and topics to cover
+2. Week-by-week breakdown
+3. Important chapters/units priority
+4. Revision strategy
+5. Exam preparation timeline
+6. Study resources and techniques
+
+Make it detailed and motivating!"""
+
+
+def subject_help_prompt(subject, level):
+    return f"""You are an AI Study Assistant. Provide effective study strategies for {subject} specifically for {level} students.
+
+Include:
+1. Key topics to focus on
+2. Best study methods for this subject
+3. Common mistakes to avoid
+4. Resource recommendations
+5. Practice tips
+6. Time management for this subject
+
+Be specific and practical!"""
+
+
+def category_prompt(recommendation, category):
+    return f"""You are an AI Study Assistant. A student is asking about {recommendation} from the {category} category.
+
+Provide detailed, practical advice with:
+1. Clear explanation
+2. Step-by-step guide
+3. Real examples
+4. Common mistakes to avoid
+5. Quick action tips
+
+Make it engaging and actionable!"""
+
+
+def quick_question_prompt(question):
+    """Prompt for a QUICK_QUESTIONS entry (emoji prefix included)"""
+    return f"""You are an AI Study Assistant. Answer this question with practical, actionable advice:
+{question.split(' ', 1)[1]}"""
+
+
+def canned_prompts():
+    """Every (label, prompt) a Chat page button can send"""
+    for level in EDUCATION_LEVELS:
+        yield f"timetable: {level}", timetable_prompt(level)
+        yield f"planner: {level}", planner_prompt(level)
+        for subject in subjects_for(level):
+            yield f"subject: {subject} / {level}", subject_help_prompt(subject, level)
+    for category, recommendations in CATEGORIES.items():
+        for recommendation in recommendations:
+            yield f"category: {recommendation}", category_prompt(recommendation, category)
+    for question in QUICK_QUESTIONS:
+        yield f"quick: {question}", quick_question_prompt(question)
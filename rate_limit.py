@@ -0,0 +1,186 @@
+import atexit
+import sqlite3
+import threading
+import time
+
+
+class TokenBucketLimiter:
+    """Per-key token buckets held in one dict of [tokens, last_refill]
+
+    Each key may spend up to `capacity` tokens in a burst, refilled at
+    `refill_per_sec`. A bucket that has been idle long enough to be full
+    again carries no information, so it is dropped by the periodic sweep;
+    memory therefore tracks only keys seen recently. If the table still
+    grows past `max_keys`, the least recently touched buckets go first.
+    """
+
+    def __init__(self, capacity, refill_per_sec, max_keys=100_000, sweep_interval=60.0):
+        self.capacity = float(capacity)
+        self.refill_per_sec = float(refill_per_sec)
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self.allowed = 0
+        self.rejected = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def _refill(self, bucket, now):
+        tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_sec)
+        bucket[0], bucket[1] = tokens, now
+        return tokens
+
+    def try_acquire(self, key, cost=1.0):
+        """Spend tokens for key; returns (allowed, seconds_until_allowed)"""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.capacity, now]
+            tokens = self._refill(bucket, now)
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                self.allowed += 1
+                return True, 0.0
+            self.rejected += 1
+            return False, (cost - tokens) / self.refill_per_sec
+
+    def refund(self, key, cost=1.0):
+        """Give back tokens spent by try_acquire (never above capacity)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.capacity, self._refill(bucket, now) + cost)
+
+    def _sweep(self, now):
+        """Drop buckets that have refilled completely; caller holds the lock"""
+        for key in [k for k, (tokens, last) in self._buckets.items()
+                    if tokens + (now - last) * self.refill_per_sec >= self.capacity]:
+            del self._buckets[key]
+        if len(self._buckets) > self.max_keys:
+            by_age = sorted(self._buckets, key=lambda k: self._buckets[k][1])
+            for key in by_age[:len(self._buckets) - self.max_keys]:
+                del self._buckets[key]
+        self._next_sweep = now + self.sweep_interval
+
+    def sweep(self):
+        """Run eviction now"""
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    def __len__(self):
+        return len(self._buckets)
+
+    # ─── Persistence ───────────────────────────────────────────────
+    def snapshot(self):
+        """Partially drained buckets as (key, tokens, seconds_since_refill)"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, tokens, now - last) for key, (tokens, last) in self._buckets.items()
+                    if tokens + (now - last) * self.refill_per_sec < self.capacity]
+
+    def restore(self, rows):
+        """Load rows produced by snapshot(), e.g. after a restart"""
+        now = time.monotonic()
+        with self._lock:
+            for key, tokens, age in rows:
+                self._buckets[key] = [float(tokens), now - max(0.0, float(age))]
+
+
+class LoginThrottle:
+    """Token-bucket limits on login and password-reset attempts
+
+    Attempts are limited per account (username or email) and per client
+    (IP address or browser session), so a credential-stuffing burst
+    against one account or from one client is cut off before any
+    password hashing or database work happens. A successful login gives
+    its account token back, so only failures count against an account.
+    """
+
+    # (capacity, refill per second) for each scope
+    DEFAULT_LIMITS = {
+        'login_account': (5, 1 / 12),      # 5 at once, then 5 per minute
+        'login_client': (20, 1 / 3),       # 20 at once, then 20 per minute
+        'reset_account': (3, 1 / 300),     # 3 at once, then 1 per 5 minutes
+        'reset_client': (10, 1 / 60),      # 10 at once, then 1 per minute
+    }
+
+    def __init__(self, limits=None, persist_path=None):
+        config = dict(self.DEFAULT_LIMITS, **(limits or {}))
+        self.limiters = {
+            scope: TokenBucketLimiter(capacity, rate) for scope, (capacity, rate) in config.items()
+        }
+        self.persist_path = persist_path
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def check(self, action, account, client_id=None):
+        """Return (allowed, retry_after_seconds) for a login/reset attempt"""
+        ok, wait = self.limiters[f'{action}_account'].try_acquire(account.lower())
+        if not ok:
+            return False, wait
+        if client_id:
+            ok, wait = self.limiters[f'{action}_client'].try_acquire(client_id)
+            if not ok:
+                return False, wait
+        return True, 0.0
+
+    def succeeded(self, action, account):
+        """Refund the account's token after a successful attempt"""
+        self.limiters[f'{action}_account'].refund(account.lower())
+
+    def stats(self):
+        """Tracked keys and allow/reject counters per scope"""
+        return {
+            scope: {'keys': len(lim), 'allowed': lim.allowed, 'rejected': lim.rejected}
+            for scope, lim in self.limiters.items()
+        }
+
+    # ─── Optional SQLite persistence ───────────────────────────────
+    def _connect(self):
+        conn = sqlite3.connect(self.persist_path, timeout=5)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS throttle_buckets (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                tokens REAL NOT NULL,
+                age_seconds REAL NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (scope, key)
+            )
+        ''')
+        return conn
+
+    def save(self):
+        """Write drained buckets so a restart doesn't reset the limits"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute('DELETE FROM throttle_buckets')
+            for scope, limiter in self.limiters.items():
+                conn.executemany('''
+                    INSERT INTO throttle_buckets (scope, key, tokens, age_seconds, saved_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(scope, key, tokens, age, now) for key, tokens, age in limiter.snapshot()])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self):
+        """Restore buckets saved by a previous process"""
+        conn = self._connect()
+        try:
+            now = time.time()
+            for scope, limiter in self.limiters.items():
+                rows = conn.execute('''
+                    SELECT key, tokens, age_seconds + (? - saved_at)
+                    FROM throttle_buckets
+                    WHERE scope = ?
+                ''', (now, scope)).fetchall()
+                limiter.restore(rows)
+        finally:
+            conn.close()
@@ -0,0 +1,211 @@
+"""Process-wide admission control for Gemini requests
+
+Every request waits for a token from a bucket sized to the API quota
+before it is sent, so a burst of users queues up here instead of turning
+into guaranteed 429s. Waiting requests are served by lane - interactive
+chat first, then study plans, then batch jobs such as the cache warm-up -
+and first come, first served within a lane. The queue is bounded; past
+that, callers are turned away immediately.
+
+When Gemini does answer 429, everyone pauses for its Retry-After (or an
+exponential backoff with jitter) rather than hammering it again.
+"""
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+from rate_limit import TokenBucketLimiter
+
+LANES = ("interactive", "plan", "batch")
+
+# Free-tier quota for gemini-flash; override with GEMINI_RPM
+DEFAULT_RPM = 15
+
+# How often queued callers get a fresh position/ETA
+STATUS_INTERVAL = 1.0
+
+
+class QueueFull(Exception):
+    """Too many requests are already waiting"""
+
+
+class QueueTimeout(Exception):
+    """A request waited longer than max_wait without being admitted"""
+
+
+class RequestAbandoned(Exception):
+    """Nobody wanted the answer any more, so the request left the queue"""
+
+
+def retry_after_seconds(response):
+    """Delay Gemini asked for on a 429, from Retry-After or the error's RetryInfo"""
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        pass
+    try:
+        details = response.json().get("error", {}).get("details", [])
+    except ValueError:
+        return None
+    for detail in details:
+        # google.rpc.RetryInfo, e.g. {"retryDelay": "37s"}
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)s", str(detail.get("retryDelay", "")))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class RequestScheduler:
+    """Token bucket plus a priority queue of waiting requests
+
+    acquire() blocks until the caller may send one request. Only the
+    request at the head of the queue draws tokens, so a higher lane always
+    goes next and nothing is starved by luckier threads.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, burst=None, max_queue=200, max_wait=120.0,
+                 max_retries=3, base_backoff=2.0, max_backoff=60.0):
+        self.rpm = rpm
+        self.limiter = TokenBucketLimiter(capacity=burst or min(5, rpm), refill_per_sec=rpm / 60)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._throttle_streak = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.throttled_count = 0
+
+    def acquire(self, lane="interactive", on_wait=None, abandoned=None):
+        """Block until a request may be sent
+
+        on_wait(position, eta_seconds) is called while queued whenever the
+        position or ETA changes, and once with (0, 0) when admitted after
+        waiting. abandoned() is polled while queued; once it returns True
+        the request gives up its place. Raises QueueFull, QueueTimeout or
+        RequestAbandoned.
+        """
+        ticket = (LANES.index(lane), next(self._seq))
+        with self._cond:
+            if not self._queue and time.monotonic() >= self._paused_until:
+                allowed, _ = self.limiter.try_acquire("gemini")
+                if allowed:
+                    self.admitted += 1
+                    return
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull()
+            heapq.heappush(self._queue, ticket)
+            self.queued += 1
+
+        deadline = time.monotonic() + self.max_wait
+        reported = None
+        try:
+            while True:
+                # Outside the lock: the check may take the caller's own locks
+                if abandoned is not None and abandoned():
+                    raise RequestAbandoned()
+                with self._cond:
+                    now = time.monotonic()
+                    wait = STATUS_INTERVAL
+                    if self._queue[0] == ticket:
+                        if now >= self._paused_until:
+                            allowed, wait = self.limiter.try_acquire("gemini")
+                            if allowed:
+                                heapq.heappop(self._queue)
+                                self.admitted += 1
+                                self._cond.notify_all()
+                                break
+                        else:
+                            wait = self._paused_until - now
+                    if now >= deadline:
+                        raise QueueTimeout()
+                    position = 1 + sum(1 for other in self._queue if other < ticket)
+                    eta = self._eta(position, now)
+                    self._cond.wait(min(wait, STATUS_INTERVAL, deadline - now))
+                # Report outside the lock; callbacks may be slow
+                if on_wait is not None and (position, eta) != reported:
+                    reported = (position, eta)
+                    on_wait(position, eta)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                self._cond.notify_all()
+            raise
+        if on_wait is not None and reported is not None:
+            on_wait(0, 0)
+
+    def try_acquire(self):
+        """Admit a request only if nobody is waiting and a token is free"""
+        with self._cond:
+            if self._queue or time.monotonic() < self._paused_until:
+                return False
+            allowed, _ = self.limiter.try_acquire("gemini")
+            if allowed:
+                self.admitted += 1
+            return allowed
+
+    def _eta(self, position, now):
+        """Rough seconds until `position` is admitted; caller holds the lock"""
+        return round(max(0.0, self._paused_until - now) + (position - 1) * 60 / self.rpm)
+
+    def throttled(self, retry_after=None):
+        """Gemini answered 429: hold every lane for retry_after or a backoff"""
+        with self._cond:
+            self._throttle_streak += 1
+            self.throttled_count += 1
+            if retry_after is None:
+                retry_after = min(self.max_backoff, self.base_backoff * 2 ** (self._throttle_streak - 1))
+                retry_after *= random.uniform(0.5, 1.0)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def succeeded(self):
+        """A request got through; reset the backoff"""
+        with self._cond:
+            self._throttle_streak = 0
+
+    def stats(self):
+        """Admission counters and what is waiting in each lane"""
+        with self._cond:
+            waiting = {lane: 0 for lane in LANES}
+            for rank, _ in self._queue:
+                waiting[LANES[rank]] += 1
+            return {
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'throttled': self.throttled_count,
+                'paused_for': max(0.0, self._paused_until - time.monotonic()),
+                'waiting': waiting,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(**options):
+    """Get the shared RequestScheduler for this process (options used on first call)
+
+    rpm defaults to the GEMINI_RPM environment variable.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                options.setdefault("rpm", float(os.environ.get("GEMINI_RPM", DEFAULT_RPM)))
+                _scheduler = RequestScheduler(**options)
+    return _scheduler
@@ -0,0 +1,158 @@
+"""Retry budget, backoff, circuit breaker and latency tracking for Gemini calls
+
+generateContent has no side effects, so a failed or slow call can safely
+be sent again. What needs bounding is the extra load: retries and hedged
+copies both draw from a RetryBudget that only refills as real requests
+go out, so an outage can't turn into a retry storm. When failures keep
+coming anyway the CircuitBreaker opens and calls fail fast until a probe
+gets through.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpen(Exception):
+    """Upstream has been failing; the call was not attempted"""
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff for retry number `attempt` (from 0)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """Extra sends allowed as a fraction of first sends
+
+    Every request deposits `ratio` tokens (up to `reserve`); every retry
+    or hedge withdraws one. Healthy traffic keeps the full reserve for
+    occasional blips; sustained failure is limited to `ratio` extra
+    requests per request.
+    """
+
+    def __init__(self, ratio=0.2, reserve=5):
+        self.ratio = ratio
+        self.reserve = float(reserve)
+        self.balance = float(reserve)
+        self.withdrawn = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.reserve, self.balance + self.ratio)
+
+    def withdraw(self):
+        """Take one token; False if the budget is spent"""
+        with self._lock:
+            if self.balance >= 1:
+                self.balance -= 1
+                self.withdrawn += 1
+                return True
+            self.exhausted += 1
+            return False
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures
+
+    While open, check() raises CircuitOpen. After `reset_timeout` seconds
+    one probe is let through (half-open); its success closes the breaker,
+    its failure opens it again. A probe that ends without a verdict (a
+    429, a queue timeout, an unexpected error) is handed back with
+    release(), and one that is never resolved expires after
+    `probe_timeout` seconds, so a lost probe can't keep the breaker open.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, probe_timeout=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = reset_timeout if probe_timeout is None else probe_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe = None
+        self._probe_started = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _probe_free(self, now):
+        """True if a call may go ahead now; caller holds the lock"""
+        if self.state == "open" and now - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._probe = None
+        if self.state != "half_open":
+            return False
+        return self._probe is None or now - self._probe_started >= self.probe_timeout
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go ahead (doesn't claim the probe)"""
+        with self._lock:
+            if self.state == "closed" or self._probe_free(time.monotonic()):
+                return
+            self.rejected += 1
+            raise CircuitOpen()
+
+    def begin(self):
+        """Claim the probe slot right before sending, if the breaker needs one
+
+        Returns a probe token to pass to release(), or None when the
+        breaker is closed. Raises CircuitOpen if another call holds the
+        probe.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return None
+            now = time.monotonic()
+            if not self._probe_free(now):
+                self.rejected += 1
+                raise CircuitOpen()
+            self._probes += 1
+            self._probe = self._probes
+            self._probe_started = now
+            return self._probe
+
+    def release(self, probe):
+        """Hand back a probe that ended without record_success/record_failure"""
+        if probe is None:
+            return
+        with self._lock:
+            if self._probe == probe:
+                self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe = None
+
+
+class LatencyTracker:
+    """Recent latencies (seconds) for percentile estimates"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """The q-quantile (0-1) of recent samples, or None until min_samples"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,190 @@
+"""Two-tier cache of Gemini replies
+
+Canned prompts (the Chat page's planner, subject and category buttons)
+always produce the same request, so their replies are kept: first in an
+in-process LRU, then in a SQLite file shared by every process on the
+host and surviving restarts. Keys cover the normalized prompt, the model
+and the generationConfig, so changing any of them misses.
+
+Usage:
+    python response_cache.py stats
+    python response_cache.py purge
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+
+from background import PeriodicTask
+from db_pool import get_pool, RetryPolicy
+from ttl_cache import TTLCache
+
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so indentation/line-ending differences still hit"""
+    return " ".join(prompt.split())
+
+
+def make_key(prompt, model, generation_config):
+    """Stable cache key for one request"""
+    raw = json.dumps(
+        {"prompt": normalize_prompt(prompt), "model": model, "config": generation_config},
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Memory LRU tier in front of a SQLite tier, both with TTL expiry"""
+
+    def __init__(self, path="gemini_cache.db", memory_size=512, ttl=DEFAULT_TTL, sweep_interval=3600):
+        self.path = path
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=memory_size, ttl=ttl)
+        self.pool = get_pool(path, max_size=4)
+        self.retry = RetryPolicy()
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._init_db()
+        self.sweeper = None
+        if sweep_interval:
+            self.sweeper = PeriodicTask(sweep_interval, self.purge_expired, name="response-cache-sweeper").start()
+
+    def _init_db(self):
+        def create():
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS response_cache (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at
+                    ON response_cache (expires_at)
+                ''')
+                conn.commit()
+        self.retry.run(create)
+
+    def get(self, key):
+        """Cached reply text, or None"""
+        text = self.memory.get(key)
+        if text is not None:
+            return text
+
+        now = time.time()
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT response, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+                (key, now),
+            ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        # Promote, keeping the disk entry's remaining lifetime
+        self.memory.set(key, row[0], ttl=row[1] - now)
+        return row[0]
+
+    def set(self, key, text, model="", ttl=None):
+        """Store a reply in both tiers"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        self.memory.set(key, text, ttl=ttl)
+
+        def write():
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO response_cache (key, model, response, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (key, model, text, now, now + ttl))
+                conn.commit()
+        self.retry.run(write)
+
+    def contains(self, key, min_ttl=0):
+        """True if a disk entry lives at least `min_ttl` more seconds
+
+        Doesn't touch hit counters, so the warm-up job can check keys
+        without skewing the hit ratio.
+        """
+        with self.pool.connection() as conn:
+            return conn.execute(
+                'SELECT 1 FROM response_cache WHERE key = ? AND expires_at > ?', (key, time.time() + min_ttl)
+            ).fetchone() is not None
+
+    def purge_expired(self):
+        """Delete expired disk entries; returns the number removed"""
+        def delete():
+            with self.pool.connection() as conn:
+                removed = conn.execute(
+                    'DELETE FROM response_cache WHERE expires_at <= ?', (time.time(),)
+                ).rowcount
+                conn.commit()
+                return removed
+        return self.retry.run(delete)
+
+    def stats(self):
+        """Hit/miss counters per tier and the overall hit ratio"""
+        memory = self.memory.stats()
+        with self._lock:
+            disk_hits, misses = self.disk_hits, self.misses
+        with self.pool.connection() as conn:
+            disk_size = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+        lookups = memory['hits'] + disk_hits + misses
+        return {
+            'memory_hits': memory['hits'],
+            'disk_hits': disk_hits,
+            'misses': misses,
+            'memory_size': memory['size'],
+            'memory_evictions': memory['evictions'],
+            'disk_size': disk_size,
+            'hit_ratio': (memory['hits'] + disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self.sweeper is not None:
+            self.sweeper.stop()
+        self.pool.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(**options):
+    """Get the shared ResponseCache for this process (options used on first call)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(**options)
+    return _cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the Gemini response cache")
+    parser.add_argument('--path', default='gemini_cache.db')
+    parser.add_argument('command', choices=['stats', 'purge'])
+    args = parser.parse_args()
+
+    cache = ResponseCache(args.path, sweep_interval=0)
+    try:
+        if args.command == 'purge':
+            print(f"🗑️ Removed {cache.purge_expired()} expired responses")
+        else:
+            for name, value in cache.stats().items():
+                print(f"{name:<18} {value}")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Coalescing of identical in-flight requests
+
+When many sessions send the same request at once (a class all clicking
+"Create Timetable" for the same level), only the first starts an upstream
+call. Everyone else subscribes to it: chunks are fanned out to every
+subscriber as they arrive, and late joiners get a replay of what has
+already been received.
+
+The upstream call runs on a thread of its own rather than in the first
+caller's thread, so any subscriber - including the first - can time out
+or cancel without affecting the others. If every subscriber leaves, the
+upstream call is abandoned: it is never started if nobody is left by
+the time its thread starts, it is passed an abandoned() check to give
+up its place in a queue, and no more chunks are pulled from it. There
+is no worker pool: a pool would hold calls back before they reach the
+request scheduler, where they are counted, bounded and shown their place
+in line.
+
+The upstream call can also publish a status (e.g. its place in the rate
+limit queue). Subscribers see it in their own thread, which matters for
+Streamlit: elements can only be updated from the session's script thread.
+"""
+import threading
+import time
+
+# How often waiters re-check their cancel event
+CANCEL_POLL_SECONDS = 0.1
+
+
+class FlightTimeout(Exception):
+    """No new chunk arrived within the subscriber's timeout"""
+
+
+class FlightCancelled(Exception):
+    """The subscriber's cancel event was set while waiting"""
+
+
+class _Flight:
+    """Chunks received so far for one in-flight call, plus its subscribers"""
+
+    def __init__(self):
+        self.chunks = []
+        self.status = None
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False
+        self.cond = threading.Condition()
+
+    def publish(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def set_status(self, status):
+        with self.cond:
+            self.status = status
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+    def follow(self, timeout=None, cancel=None, on_status=None):
+        """Yield every chunk from the first one, waiting for new ones
+
+        on_status(status) is called from this thread whenever the status
+        changes. Any progress (a chunk or a status change) restarts the
+        timeout.
+        """
+        index = 0
+        seen_status = None
+        while True:
+            with self.cond:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while (index >= len(self.chunks) and not self.done
+                       and (on_status is None or self.status == seen_status)):
+                    if cancel is not None and cancel.is_set():
+                        raise FlightCancelled()
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise FlightTimeout()
+                    if cancel is not None:
+                        remaining = CANCEL_POLL_SECONDS if remaining is None else min(remaining, CANCEL_POLL_SECONDS)
+                    self.cond.wait(remaining)
+                status = self.status
+                new = self.chunks[index:]
+                index += len(new)
+                finished = self.done and index >= len(self.chunks)
+                error = self.error
+            # Callbacks and yields happen outside the lock so a slow
+            # subscriber can't stall the others
+            if on_status is not None and status != seen_status:
+                seen_status = status
+                on_status(status)
+            yield from new
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Runs at most one upstream call per key and shares it with every caller"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def stream(self, key, make_chunks, timeout=None, cancel=None, on_status=None):
+        """Yield the chunks of make_chunks(set_status, abandoned), shared with identical calls in flight
+
+        `timeout` is the longest wait for the next chunk; `cancel` is an
+        optional threading.Event. Closing the generator (e.g. when a
+        Streamlit rerun interrupts rendering) also unsubscribes. Whatever
+        the upstream call passes to set_status reaches on_status, and
+        abandoned() tells it that every subscriber has left.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            start = flight is None
+            if start:
+                flight = self._flights[key] = _Flight()
+                self.started += 1
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+
+        if start:
+            threading.Thread(target=self._run, args=(key, flight, make_chunks),
+                             name="single-flight", daemon=True).start()
+        try:
+            yield from flight.follow(timeout, cancel, on_status)
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+
+    def do(self, key, fn, timeout=None, cancel=None, on_status=None):
+        """Return fn(set_status, abandoned), shared with identical calls in flight"""
+        make_chunks = lambda set_status, abandoned: iter([fn(set_status, abandoned)])
+        for result in self.stream(key, make_chunks, timeout, cancel, on_status):
+            return result
+
+    def _abandon(self, key, flight):
+        """True if nobody is listening any more; the flight is then closed to joiners
+
+        Decided under the lock so no one can join a dead flight, and
+        final: once abandoned, a flight stays abandoned.
+        """
+        with self._lock:
+            if flight.abandoned:
+                return True
+            if flight.subscribers:
+                return False
+            flight.abandoned = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            self.abandoned += 1
+            return True
+
+    def _run(self, key, flight, make_chunks):
+        error = None
+        chunks = None
+        abandoned = lambda: self._abandon(key, flight)
+        try:
+            if abandoned():
+                return
+            chunks = make_chunks(flight.set_status, abandoned)
+            for chunk in chunks:
+                flight.publish(chunk)
+                # Nobody is listening any more; stop pulling from upstream
+                if abandoned():
+                    break
+        except Exception as e:
+            error = e
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.finish(error)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self):
+        """How many calls started upstream, joined one, or were abandoned"""
+        with self._lock:
+            return {
+                'started': self.started,
+                'coalesced': self.coalesced,
+                'abandoned': self.abandoned,
+                'in_flight': len(self._flights),
+            }
@@ -0,0 +1,197 @@
+"""Storage backends for AuthDB
+
+AuthDB writes its SQL once, with `?` placeholders, and gets connections,
+transaction handling and error classification from a backend:
+
+- SQLiteBackend: a local file (users.db) through the pooled connections
+  in db_pool. The default.
+- PostgresBackend: a shared PostgreSQL server, so several app replicas
+  can sit behind a load balancer and see the same accounts. Needs
+  psycopg2 (`pip install psycopg2-binary`), imported only when used.
+
+make_backend() picks one from a path or a postgresql:// URL.
+"""
+import sqlite3
+from functools import lru_cache
+
+from db_pool import POOL_EXHAUSTED, ConnectionPool, get_pool, is_busy_error
+
+# Serialization failure, deadlock, lock_timeout hit
+RETRYABLE_PGCODES = {'40001', '40P01', '55P03'}
+
+
+class StorageBackend:
+    """What AuthDB needs from a database"""
+
+    # Picks the migration list and any SQL that differs per database
+    dialect = None
+    # Raised on UNIQUE violations; the message names the column/constraint
+    IntegrityError = Exception
+    has_returning = True
+
+    def connection(self):
+        """Context manager yielding a pooled DB-API connection"""
+        raise NotImplementedError
+
+    def begin_write(self, cursor):
+        """Start a write transaction on cursor"""
+        raise NotImplementedError
+
+    def lock_schema(self, cursor):
+        """Start a transaction that serializes schema migrations"""
+        raise NotImplementedError
+
+    def is_busy_error(self, error):
+        """True for lock/contention errors worth retrying"""
+        raise NotImplementedError
+
+    def close(self):
+        """Close idle pooled connections"""
+        raise NotImplementedError
+
+
+class SQLiteBackend(StorageBackend):
+    """Local SQLite file shared by the threads/processes of one host"""
+
+    dialect = 'sqlite'
+    IntegrityError = sqlite3.IntegrityError
+    # UPDATE ... RETURNING needs SQLite 3.35+
+    has_returning = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    def __init__(self, db_path="users.db", pool_size=8, busy_timeout_ms=5000, pragmas=None):
+        self.db_path = db_path
+        self.pool = get_pool(db_path, max_size=pool_size, busy_timeout_ms=busy_timeout_ms, pragmas=pragmas)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def begin_write(self, cursor):
+        # Take the write lock up front so a busy database is reported
+        # (and retried) before any work is done
+        cursor.execute('BEGIN IMMEDIATE')
+
+    lock_schema = begin_write
+
+    def is_busy_error(self, error):
+        return is_busy_error(error)
+
+    def close(self):
+        self.pool.close()
+
+
+@lru_cache(maxsize=512)
+def to_format_paramstyle(sql):
+    """Rewrite `?` placeholders as `%s` (and escape literal `%`)
+
+    AuthDB's SQL never has `?` inside string literals, so a plain
+    replace is enough.
+    """
+    return sql.replace('%', '%%').replace('?', '%s')
+
+
+class _PgCursor:
+    """Cursor wrapper accepting AuthDB's `?` placeholders"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(to_format_paramstyle(sql), params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(to_format_paramstyle(sql), seq_of_params)
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _PgConnection:
+    """Connection wrapper whose cursors convert placeholders"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self):
+        return _PgCursor(self.raw.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class PostgresPool(ConnectionPool):
+    """ConnectionPool of psycopg2 connections to one server"""
+
+    def __init__(self, dsn, psycopg2, max_size=8, lock_timeout_ms=5000, connect_timeout=5):
+        super().__init__(dsn, max_size=max_size, busy_timeout_ms=lock_timeout_ms, pragmas={})
+        self.Error = psycopg2.Error
+        self._psycopg2 = psycopg2
+        self.connect_timeout = connect_timeout
+
+    def _connect(self):
+        conn = self._psycopg2.connect(
+            self.db_path,
+            connect_timeout=self.connect_timeout,
+            # Waiting on a row lock gives up like SQLite's busy_timeout
+            options=f"-c lock_timeout={int(self.busy_timeout_ms)}",
+        )
+        return _PgConnection(conn)
+
+    def _exhausted(self):
+        # A psycopg2 error, so PostgresBackend.is_busy_error can retry it
+        return self._psycopg2.OperationalError(POOL_EXHAUSTED)
+
+    def _reset(self, conn):
+        # Cheap no-op when idle; fails (and discards) a dead connection
+        conn.rollback()
+
+
+class PostgresBackend(StorageBackend):
+    """Shared PostgreSQL server, for running several app replicas"""
+
+    dialect = 'postgresql'
+    has_returning = True
+
+    def __init__(self, dsn, pool_size=8, lock_timeout_ms=5000, connect_timeout=5):
+        try:
+            import psycopg2
+        except ImportError:
+            raise ImportError(
+                "A postgresql:// database needs psycopg2: pip install psycopg2-binary"
+            ) from None
+        self.dsn = dsn
+        self._psycopg2 = psycopg2
+        self.IntegrityError = psycopg2.IntegrityError
+        self.pool = PostgresPool(dsn, psycopg2, max_size=pool_size, lock_timeout_ms=lock_timeout_ms,
+                                 connect_timeout=connect_timeout)
+
+    def connection(self):
+        return self.pool.connection()
+
+    def begin_write(self, cursor):
+        # psycopg2 opens a transaction on the first statement, and row
+        # locks are taken as rows are written
+        pass
+
+    def lock_schema(self, cursor):
+        cursor.execute('LOCK TABLE schema_version IN SHARE ROW EXCLUSIVE MODE')
+
+    def is_busy_error(self, error):
+        """Serialization failures, deadlocks, lock timeouts and an exhausted pool"""
+        psycopg2 = self._psycopg2
+        if isinstance(error, psycopg2.extensions.TransactionRollbackError):
+            return True
+        if getattr(error, 'pgcode', None) in RETRYABLE_PGCODES:
+            return True
+        return isinstance(error, psycopg2.OperationalError) and str(error) == POOL_EXHAUSTED
+
+    def close(self):
+        self.pool.close()
+
+
+def make_backend(target="users.db", pool_size=8, busy_timeout_ms=5000, pragmas=None):
+    """SQLite for a file path, PostgreSQL for a postgres(ql):// URL"""
+    if target.startswith(('postgres://', 'postgresql://')):
+        return PostgresBackend(target, pool_size=pool_size, lock_timeout_ms=busy_timeout_ms)
+    return SQLiteBackend(target, pool_size=pool_size, busy_timeout_ms=busy_timeout_ms, pragmas=pragmas)
@@ -0,0 +1,224 @@
+"""In-process metrics for Gemini calls, exported in Prometheus text format
+
+Recording never takes a lock: each thread writes to its own shard of
+counters and histograms, and only an export merges them. Shards of
+threads that have exited (Streamlit starts a thread per script run) are
+folded into a retired total at export time, so memory tracks live
+threads.
+
+Export by scraping render() from your own endpoint, or set
+GEMINI_METRICS_FILE to have the shared client write the file every
+GEMINI_METRICS_INTERVAL seconds (default 15) - the format node_exporter's
+textfile collector reads.
+"""
+import bisect
+import os
+import threading
+
+from background import PeriodicTask
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45, 90)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'gemini_requests_total': ('counter', "Gemini calls by outcome", None),
+    'gemini_retries_total': ('counter', "Extra sends after 429s, 5xx and timeouts", None),
+    'gemini_tokens_total': ('counter', "Tokens reported in usageMetadata", None),
+    'gemini_cache_requests_total': ('counter', "Response cache lookups by result", None),
+    'gemini_cache_read_errors_total': ('counter', "Cache lookups that failed and were treated as misses", None),
+    'gemini_cache_write_errors_total': ('counter', "Replies that could not be written to the cache", None),
+    'gemini_user_quota_total': ('counter', "Per-user quota checks by decision", None),
+    'gemini_request_seconds': ('histogram', "Call latency, queue wait included", LATENCY_BUCKETS),
+    'gemini_ttfb_seconds': ('histogram', "Time to first byte of the reply (first token when streaming)",
+                            LATENCY_BUCKETS),
+    'gemini_queue_seconds': ('histogram', "Time spent waiting for the scheduler", LATENCY_BUCKETS),
+    'gemini_output_tokens': ('histogram', "Output tokens per call", TOKEN_BUCKETS),
+}
+
+
+class _Shard:
+    """One thread's counters and histograms"""
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters = {}
+        # key -> [count per bucket..., count over the last bucket, sum]
+        self.histograms = {}
+
+
+class Metrics:
+    """Labelled counters and histograms with per-thread shards
+
+    Labels are passed as a tuple of (name, value) pairs so they can key
+    a dict without building one per call.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard(None)
+        self._lock = threading.Lock()
+        self._collectors = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        histograms = self._shard().histograms
+        key = (name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            entry = histograms[key] = [0] * (len(buckets) + 2)
+        entry[bisect.bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+    def add_collector(self, fn):
+        """fn() -> [(name, help, labels, value)] gauges, evaluated at export"""
+        self._collectors.append(fn)
+
+    @staticmethod
+    def _merge_into(target, shard):
+        # dict.copy() is atomic under the GIL, so a writer can't tear it
+        for key, value in shard.counters.copy().items():
+            target.counters[key] = target.counters.get(key, 0) + value
+        for key, entry in shard.histograms.copy().items():
+            merged = target.histograms.setdefault(key, [0] * len(entry))
+            for i, value in enumerate(list(entry)):
+                merged[i] += value
+
+    def snapshot(self):
+        """Merged counters and histograms of every thread"""
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    self._merge_into(self._retired, shard)
+            self._shards = live
+            total = _Shard(None)
+            self._merge_into(total, self._retired)
+        for shard in live:
+            self._merge_into(total, shard)
+        return total
+
+    def render(self):
+        """Everything recorded so far, in Prometheus text format"""
+        total = self.snapshot()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = total.counters if kind == 'counter' else total.histograms
+            keys = sorted(key for key in series if key[0] == name)
+            if not keys:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in keys:
+                labels = key[1]
+                if kind == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {series[key]}")
+                    continue
+                entry = series[key]
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), entry[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {round(entry[-1], 6)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+        gauges = {}
+        for collect in self._collectors:
+            try:
+                for name, help_text, labels, value in collect():
+                    gauges.setdefault(name, (help_text, []))[1].append((labels, value))
+            except Exception:
+                continue
+        for name, (help_text, values) in gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in values:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """Write render() to path atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class CallRecord:
+    """What one Gemini call did, filled in as it goes and recorded once"""
+
+    def __init__(self, page="unknown", prompt_type="unknown", endpoint="generate"):
+        self.labels = (('page', page), ('prompt_type', prompt_type))
+        self.endpoint = endpoint
+        self.status = "error"
+        self.finish_reason = ""
+        self.retries = 0
+        self.queue_seconds = 0.0
+        self.ttfb = None
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def use_usage(self, data):
+        """Take token counts from a response's usageMetadata, if any"""
+        usage = data.get('usageMetadata') or {}
+        self.prompt_tokens = usage.get('promptTokenCount', self.prompt_tokens)
+        self.output_tokens = usage.get('candidatesTokenCount', self.output_tokens)
+
+    def record(self, metrics, seconds):
+        labels = self.labels
+        timed = labels + (('endpoint', self.endpoint),)
+        metrics.inc('gemini_requests_total', labels + (('status', str(self.status)),
+                                                       ('finish_reason', self.finish_reason or "none")))
+        if self.retries:
+            metrics.inc('gemini_retries_total', labels, self.retries)
+        metrics.observe('gemini_request_seconds', timed, seconds)
+        metrics.observe('gemini_queue_seconds', timed, self.queue_seconds)
+        if self.ttfb is not None:
+            metrics.observe('gemini_ttfb_seconds', timed, self.ttfb)
+        if self.prompt_tokens:
+            metrics.inc('gemini_tokens_total', labels + (('kind', 'prompt'),), self.prompt_tokens)
+        if self.output_tokens:
+            metrics.inc('gemini_tokens_total', labels + (('kind', 'output'),), self.output_tokens)
+            metrics.observe('gemini_output_tokens', labels, self.output_tokens)
+
+
+metrics = Metrics()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def start_file_export(path=None, interval=None):
+    """Write the metrics file periodically if GEMINI_METRICS_FILE (or path) is set"""
+    global _exporter
+    path = path or os.environ.get("GEMINI_METRICS_FILE")
+    if not path or _exporter is not None:
+        return _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            interval = interval or float(os.environ.get("GEMINI_METRICS_INTERVAL", 15))
+            _exporter = PeriodicTask(interval, lambda: metrics.write_file(path), name="metrics-export").start()
+    return _exporter
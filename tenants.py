@@ -0,0 +1,242 @@
+"""Per-tenant sharding of the auth database
+
+Each institution (tenant) gets its own SQLite file, so writers only
+contend with users of the same institution. A small directory database
+maps tenant ids to shard files. Shards are set up lazily, once per
+process, and only the most recently used `max_open_shards` keep pooled
+connections open. Login throttling is shared by every shard, so cycling
+through tenants can't reset a limit.
+
+Usage:
+    python tenants.py add springfield-high
+    python tenants.py list
+    python tenants.py query "SELECT COUNT(*) FROM users"
+"""
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from auth_db import AuthDB, login_throttle_enabled
+from background import PeriodicTask
+from password_hashing import PasswordHasher
+from rate_limit import LoginThrottle
+
+TENANT_ID_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{1,62}$')
+
+
+class TenantRouter:
+    """Routes each tenant to its own AuthDB shard"""
+
+    def __init__(self, directory_path="tenants.db", shard_dir="shards", max_open_shards=16, **db_options):
+        self.directory_path = directory_path
+        self.shard_dir = shard_dir
+        self.max_open_shards = max_open_shards
+        # One hashing pool for all shards so CPU use stays bounded
+        db_options.setdefault('hasher', PasswordHasher())
+        # One throttle too: its client buckets must outlive any one shard
+        if db_options.get('throttle', True) is True:
+            db_options['throttle'] = LoginThrottle()
+        # A single sweeper for the open shards instead of a thread per shard
+        token_sweep_interval = db_options.pop('token_sweep_interval', 300)
+        db_options['token_sweep_interval'] = 0
+        self.db_options = db_options
+        # Every shard set up so far, and the LRU subset holding connections
+        self._shards = {}
+        self._open = OrderedDict()
+        self._paths = {}
+        self._lock = threading.Lock()
+        self._init_directory()
+        self.token_sweeper = None
+        if token_sweep_interval:
+            self.token_sweeper = PeriodicTask(
+                token_sweep_interval, self.purge_expired_reset_tokens, name="reset-token-sweeper"
+            ).start()
+
+    def _connect_directory(self):
+        return sqlite3.connect(self.directory_path, timeout=5)
+
+    def _init_directory(self):
+        conn = self._connect_directory()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tenants (
+                    tenant_id TEXT PRIMARY KEY,
+                    shard_path TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def register_tenant(self, tenant_id, shard_path=None):
+        """Add a tenant to the directory and create its shard schema"""
+        if not TENANT_ID_PATTERN.match(tenant_id):
+            raise ValueError("Tenant id must be 2-63 chars: lowercase letters, digits, '-' or '_'")
+        shard_path = shard_path or os.path.join(self.shard_dir, f"{tenant_id}.db")
+        os.makedirs(os.path.dirname(shard_path) or '.', exist_ok=True)
+
+        conn = self._connect_directory()
+        try:
+            conn.execute('''
+                INSERT INTO tenants (tenant_id, shard_path, created_at)
+                VALUES (?, ?, ?)
+            ''', (tenant_id, shard_path, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Tenant already exists: {tenant_id}")
+        finally:
+            conn.close()
+
+        # Opening it once runs the migrations on the new shard
+        self.get(tenant_id)
+        return shard_path
+
+    def shard_path(self, tenant_id):
+        """Look up a tenant's shard file; raises KeyError if unknown"""
+        path = self._paths.get(tenant_id)
+        if path is None:
+            conn = self._connect_directory()
+            try:
+                row = conn.execute('SELECT shard_path FROM tenants WHERE tenant_id = ?', (tenant_id,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                raise KeyError(f"Unknown tenant: {tenant_id}")
+            path = self._paths[tenant_id] = row[0]
+        return path
+
+    def tenants(self):
+        """All (tenant_id, shard_path) pairs in the directory"""
+        conn = self._connect_directory()
+        try:
+            return conn.execute('SELECT tenant_id, shard_path FROM tenants ORDER BY tenant_id').fetchall()
+        finally:
+            conn.close()
+
+    def get(self, tenant_id):
+        """The AuthDB for a tenant, setting it up on first use
+
+        Past `max_open_shards`, the least recently used shard only gives
+        up its pooled connections; its caches and schema check are kept.
+        """
+        with self._lock:
+            db = self._open.get(tenant_id)
+            if db is not None:
+                self._open.move_to_end(tenant_id)
+                return db
+            db = self._shards.get(tenant_id)
+
+        if db is None:
+            path = self.shard_path(tenant_id)
+            # Migrations run outside the lock so other tenants aren't held up
+            built = AuthDB(path, throttle_scope=tenant_id, **self.db_options)
+            with self._lock:
+                db = self._shards.setdefault(tenant_id, built)
+            if db is not built:
+                built.close()
+
+        evicted = []
+        with self._lock:
+            self._open[tenant_id] = db
+            self._open.move_to_end(tenant_id)
+            while len(self._open) > self.max_open_shards:
+                evicted.append(self._open.popitem(last=False)[1])
+
+        # Outside the lock: it flushes buffered writes
+        for old in evicted:
+            old.release_connections()
+        return db
+
+    def purge_expired_reset_tokens(self):
+        """Delete expired reset tokens on every open shard; returns the number removed"""
+        with self._lock:
+            dbs = list(self._open.values())
+        return sum(db.purge_expired_reset_tokens() for db in dbs)
+
+    def open_shards(self):
+        with self._lock:
+            return list(self._open)
+
+    def query_all(self, sql, params=()):
+        """Run a read-only query on every shard; returns {tenant_id: rows}
+
+        Shards are opened read-only and directly, so an admin report
+        doesn't push hot tenants out of the open-shard set.
+        """
+        results = {}
+        for tenant_id, path in self.tenants():
+            if not os.path.exists(path):
+                results[tenant_id] = []
+                continue
+            conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, timeout=5)
+            try:
+                results[tenant_id] = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        return results
+
+    def close(self):
+        if self.token_sweeper is not None:
+            self.token_sweeper.stop()
+        with self._lock:
+            dbs = list(self._shards.values())
+            self._shards.clear()
+            self._open.clear()
+        for db in dbs:
+            db.close()
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_tenant_router(**options):
+    """Get the shared TenantRouter for this process (options used on first call)"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                options.setdefault('throttle', login_throttle_enabled())
+                _router = TenantRouter(**options)
+    return _router
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-tenant auth shards")
+    parser.add_argument('--directory', default='tenants.db')
+    parser.add_argument('--shard-dir', default='shards')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_add = sub.add_parser('add', help="register a tenant and create its shard")
+    p_add.add_argument('tenant_id')
+    p_add.add_argument('--shard-path')
+    sub.add_parser('list', help="list tenants and their shard files")
+    p_query = sub.add_parser('query', help="run a read-only SQL query on every shard")
+    p_query.add_argument('sql')
+    args = parser.parse_args()
+
+    router = TenantRouter(args.directory, args.shard_dir)
+    try:
+        if args.command == 'add':
+            try:
+                path = router.register_tenant(args.tenant_id, args.shard_path)
+            except ValueError as e:
+                raise SystemExit(f"❌ {e}")
+            print(f"✅ Tenant {args.tenant_id} -> {path}")
+        elif args.command == 'list':
+            for tenant_id, path in router.tenants():
+                print(f"{tenant_id:<32} {path}")
+        else:
+            for tenant_id, rows in router.query_all(args.sql).items():
+                for row in rows:
+                    print(tenant_id, *row, sep='\t')
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
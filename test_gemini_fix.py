@@ -1,49 +1,15 @@
-import requests
 from config import GEMINI_API_KEY
-
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
+from gemini_client import get_client
 
 def test_gemini_api():
     """Test Gemini API with timetable generation"""
     prompt = "Create a simple daily study timetable for a Class 10th student. Keep it brief."
     
     try:
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {"text": prompt}
-                    ]
-                }
-            ],
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_NONE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_NONE"
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 2048
-            }
-        }
+        client = get_client(GEMINI_API_KEY)
         
         print("Testing Gemini API...")
-        response = requests.post(GEMINI_API_URL, json=payload, timeout=45)
+        response = client.post_generate(prompt)
         
         print(f"Status Code: {response.status_code}")
         
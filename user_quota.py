@@ -0,0 +1,447 @@
+"""Per-user Gemini quotas
+
+Every logged-in user gets their own request and token allowance, so one
+heavy user can't use up the project-wide Gemini quota for everyone:
+
+- rolling windows: requests in the last minute, tokens in the last hour
+- fixed windows: requests and tokens per UTC day
+
+Counters live in memory. Daily totals are flushed to SQLite in batches
+every few seconds and read back the first time a user is seen, so a
+restart doesn't hand out a fresh day. Rolling windows are short and stay
+in memory only. Several processes each add their own increments, but
+only see each other's at load time.
+
+A user close to a token limit gets shorter answers (a lower
+maxOutputTokens); one over a limit is turned away before any API call.
+admit() reserves the request; settle() then charges the tokens Gemini
+reports in usageMetadata, or hands the request back if it never reached
+Gemini (a cache hit, a full queue, an open circuit).
+
+Usage:
+    python user_quota.py stats [--day 2026-10-17]
+    python user_quota.py purge [--keep-days 90]
+"""
+import argparse
+import atexit
+import collections
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from background import PeriodicTask
+from db_pool import get_pool, RetryPolicy
+from telemetry import metrics
+
+DEFAULT_LIMITS = {
+    'requests_per_minute': 6,
+    'tokens_per_hour': 60_000,
+    'requests_per_day': 200,
+    'tokens_per_day': 300_000,
+}
+
+# Environment variable for each limit; 0 turns that limit off
+LIMIT_ENV = {
+    'requests_per_minute': "GEMINI_USER_RPM",
+    'tokens_per_hour': "GEMINI_USER_HOURLY_TOKENS",
+    'requests_per_day': "GEMINI_USER_DAILY_REQUESTS",
+    'tokens_per_day': "GEMINI_USER_DAILY_TOKENS",
+}
+
+REJECT_MESSAGES = {
+    'requests_per_minute': "⚠️ You're sending requests too quickly. Please wait {wait} and try again.",
+    'tokens_per_hour': "⚠️ You've used a lot of AI time this hour. Please try again in {wait}.",
+    'requests_per_day': "⚠️ You've reached today's AI request limit. It resets in {wait}.",
+    'tokens_per_day': "⚠️ You've reached today's AI usage limit. It resets in {wait}.",
+}
+
+
+def utc_day(now):
+    return datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%d')
+
+
+def seconds_until_midnight(now):
+    moment = datetime.fromtimestamp(now, timezone.utc)
+    midnight = (moment + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - moment).total_seconds()
+
+
+def format_wait(seconds):
+    seconds = max(1, int(seconds + 0.999))
+    if seconds < 120:
+        return f"{seconds}s"
+    if seconds < 7200:
+        return f"{seconds // 60} min"
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+
+
+class QuotaDecision:
+    """Outcome of QuotaManager.admit()
+
+    `max_output_tokens` is the cap to send with the request (lower than
+    asked for when degraded). A rejection carries the limit that was hit
+    and how long until it frees up.
+    """
+
+    def __init__(self, allowed, max_output_tokens=None, degraded=False, limit=None, retry_after=0.0):
+        self.allowed = allowed
+        self.max_output_tokens = max_output_tokens
+        self.degraded = degraded
+        self.limit = limit
+        self.retry_after = retry_after
+
+    @property
+    def message(self):
+        """User-facing explanation of a rejection"""
+        if self.allowed:
+            return ""
+        return REJECT_MESSAGES[self.limit].format(wait=format_wait(self.retry_after))
+
+
+class _Usage:
+    """One user's counters"""
+
+    def __init__(self, day, requests, tokens):
+        self.day = day
+        self.day_requests = requests
+        self.day_tokens = tokens
+        # Request times in the last minute, and [minute, tokens] for the last hour
+        self.calls = collections.deque()
+        self.minutes = collections.deque()
+        self.last_seen = 0.0
+
+    def trim(self, now):
+        while self.calls and self.calls[0] <= now - 60:
+            self.calls.popleft()
+        current_minute = int(now // 60)
+        while self.minutes and self.minutes[0][0] <= current_minute - 60:
+            self.minutes.popleft()
+
+    def hour_tokens(self):
+        return sum(tokens for _, tokens in self.minutes)
+
+
+class QuotaManager:
+    """Rolling- and fixed-window limits per user, persisted in batches
+
+    `limits` overrides DEFAULT_LIMITS; a limit of 0 is not enforced.
+    Past `degrade_at` of a token limit, answers are capped at
+    `degraded_output_tokens`; with less than `min_output_tokens` left,
+    requests are rejected.
+    """
+
+    def __init__(self, path="gemini_usage.db", limits=None, degrade_at=0.8, degraded_output_tokens=512,
+                 min_output_tokens=128, flush_interval=5.0, idle_ttl=3600):
+        self.path = path
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.degrade_at = degrade_at
+        self.degraded_output_tokens = degraded_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.idle_ttl = idle_ttl
+        self.admitted = 0
+        self.degraded = 0
+        self.refunded = 0
+        self.rejected = collections.Counter()
+        self.flushed = 0
+        self._users = {}
+        # (user_key, day) -> [requests, tokens] not yet written
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.pool = get_pool(path, max_size=2)
+        self.retry = RetryPolicy()
+        self._init_db()
+        self.flusher = None
+        if flush_interval:
+            self.flusher = PeriodicTask(flush_interval, self.flush, name="user-quota-flusher").start()
+            atexit.register(self.flush)
+
+    def _init_db(self):
+        def create():
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS user_usage (
+                        user_key TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        requests INTEGER NOT NULL,
+                        tokens INTEGER NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (user_key, day)
+                    )
+                ''')
+                conn.commit()
+        self.retry.run(create)
+
+    def _load(self, user_key, day):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT requests, tokens FROM user_usage WHERE user_key = ? AND day = ?', (user_key, day)
+            ).fetchone()
+        return row or (0, 0)
+
+    def _usage(self, user_key, now):
+        """Counters for user_key, read from disk on first sight or a new day"""
+        day = utc_day(now)
+        with self._lock:
+            usage = self._users.get(user_key)
+            if usage is not None and usage.day == day:
+                return usage
+        # Read outside the lock; a racing caller just loads the same row
+        requests, tokens = self._load(user_key, day)
+        with self._lock:
+            usage = self._users.get(user_key)
+            if usage is None:
+                usage = self._users[user_key] = _Usage(day, requests, tokens)
+            elif usage.day != day:
+                usage.day, usage.day_requests, usage.day_tokens = day, requests, tokens
+            return usage
+
+    def _pend(self, user_key, day, requests, tokens):
+        entry = self._pending.setdefault((user_key, day), [0, 0])
+        entry[0] += requests
+        entry[1] += tokens
+
+    def admit(self, user_key, max_output_tokens):
+        """Check user_key's limits before a call and count the request
+
+        Returns a QuotaDecision; when allowed, send at most
+        decision.max_output_tokens and call settle() once the call ends.
+        """
+        now = time.time()
+        usage = self._usage(user_key, now)
+        limits = self.limits
+        with self._lock:
+            usage.trim(now)
+            usage.last_seen = now
+            hour_tokens = usage.hour_tokens()
+
+            rejection = None
+            if limits['requests_per_minute'] and len(usage.calls) >= limits['requests_per_minute']:
+                rejection = ('requests_per_minute', usage.calls[0] + 60 - now)
+            elif limits['requests_per_day'] and usage.day_requests >= limits['requests_per_day']:
+                rejection = ('requests_per_day', seconds_until_midnight(now))
+
+            # Token headroom in whichever window is tighter
+            headroom = max_output_tokens
+            degrade = False
+            for limit, used in (('tokens_per_day', usage.day_tokens), ('tokens_per_hour', hour_tokens)):
+                if rejection is not None or not limits[limit]:
+                    continue
+                left = limits[limit] - used
+                if left < self.min_output_tokens:
+                    rejection = (limit, self._token_wait(limit, usage, now))
+                headroom = min(headroom, left)
+                degrade = degrade or used >= limits[limit] * self.degrade_at
+
+            if rejection is not None:
+                limit, wait = rejection
+                self.rejected[limit] += 1
+                decision = QuotaDecision(False, limit=limit, retry_after=max(0.0, wait))
+            else:
+                cap = min(max_output_tokens, self.degraded_output_tokens) if degrade else max_output_tokens
+                cap = min(cap, headroom)
+                usage.calls.append(now)
+                usage.day_requests += 1
+                self._pend(user_key, usage.day, 1, 0)
+                self.admitted += 1
+                if cap < max_output_tokens:
+                    self.degraded += 1
+                decision = QuotaDecision(True, max_output_tokens=cap, degraded=cap < max_output_tokens)
+
+        outcome = 'rejected' if not decision.allowed else 'degraded' if decision.degraded else 'admitted'
+        metrics.inc('gemini_user_quota_total', (('decision', outcome), ('limit', decision.limit or "none")))
+        return decision
+
+    def _token_wait(self, limit, usage, now):
+        """Seconds until `min_output_tokens` of the token limit free up; caller holds the lock"""
+        if limit == 'tokens_per_day':
+            return seconds_until_midnight(now)
+        excess = usage.hour_tokens() + self.min_output_tokens - self.limits['tokens_per_hour']
+        for minute, tokens in usage.minutes:
+            excess -= tokens
+            if excess <= 0:
+                return (minute + 60) * 60 - now
+        return 3600.0
+
+    def charge(self, user_key, tokens):
+        """Add the tokens one admitted call used"""
+        if tokens <= 0:
+            return
+        now = time.time()
+        usage = self._usage(user_key, now)
+        minute = int(now // 60)
+        with self._lock:
+            usage.day_tokens += tokens
+            if usage.minutes and usage.minutes[-1][0] == minute:
+                usage.minutes[-1][1] += tokens
+            else:
+                usage.minutes.append([minute, tokens])
+            self._pend(user_key, usage.day, 0, tokens)
+
+    def refund(self, user_key):
+        """Hand back the request admit() counted, for a call that never reached Gemini"""
+        now = time.time()
+        usage = self._usage(user_key, now)
+        with self._lock:
+            if usage.calls:
+                usage.calls.pop()
+            if usage.day_requests > 0:
+                usage.day_requests -= 1
+                self._pend(user_key, usage.day, -1, 0)
+            self.refunded += 1
+
+    def settle(self, user_key, sent, tokens):
+        """Finish an admitted call: charge the tokens Gemini reported, or
+        refund the request if it was never sent"""
+        if sent:
+            self.charge(user_key, tokens)
+        else:
+            self.refund(user_key)
+
+    def usage(self, user_key):
+        """Current counters for user_key, for display"""
+        now = time.time()
+        usage = self._usage(user_key, now)
+        with self._lock:
+            usage.trim(now)
+            return {
+                'requests_last_minute': len(usage.calls),
+                'tokens_last_hour': usage.hour_tokens(),
+                'requests_today': usage.day_requests,
+                'tokens_today': usage.day_tokens,
+            }
+
+    def flush(self):
+        """Add pending daily increments to SQLite in one transaction; returns rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._sweep(time.time())
+            if not batch:
+                return 0
+
+            def write():
+                with self.pool.connection() as conn:
+                    conn.executemany('''
+                        INSERT INTO user_usage (user_key, day, requests, tokens, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (user_key, day) DO UPDATE SET
+                            requests = requests + excluded.requests,
+                            tokens = tokens + excluded.tokens,
+                            updated_at = excluded.updated_at
+                    ''', [(user_key, day, requests, tokens, time.time())
+                          for (user_key, day), (requests, tokens) in batch.items()])
+                    conn.commit()
+
+            try:
+                self.retry.run(write)
+            except Exception:
+                # Put the increments back for the next flush
+                with self._lock:
+                    for key, (requests, tokens) in batch.items():
+                        entry = self._pending.setdefault(key, [0, 0])
+                        entry[0] += requests
+                        entry[1] += tokens
+                raise
+            self.flushed += len(batch)
+            return len(batch)
+
+    def _sweep(self, now):
+        """Forget users idle for idle_ttl whose totals are on disk; caller holds the lock"""
+        pending_users = {user_key for user_key, _ in self._pending}
+        for user_key in [k for k, usage in self._users.items()
+                         if now - usage.last_seen > self.idle_ttl and k not in pending_users]:
+            del self._users[user_key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'admitted': self.admitted,
+                'degraded': self.degraded,
+                'refunded': self.refunded,
+                'rejected': dict(self.rejected),
+                'pending': len(self._pending),
+                'flushed': self.flushed,
+            }
+
+    def top_users(self, day, limit=20):
+        """(user_key, requests, tokens) with the most tokens on day, from disk"""
+        with self.pool.connection() as conn:
+            return conn.execute('''
+                SELECT user_key, requests, tokens FROM user_usage
+                WHERE day = ?
+                ORDER BY tokens DESC
+                LIMIT ?
+            ''', (day, limit)).fetchall()
+
+    def purge(self, keep_days=90):
+        """Delete daily rows older than keep_days; returns the number removed"""
+        cutoff = utc_day(time.time() - keep_days * 86400)
+
+        def delete():
+            with self.pool.connection() as conn:
+                removed = conn.execute('DELETE FROM user_usage WHERE day < ?', (cutoff,)).rowcount
+                conn.commit()
+                return removed
+        return self.retry.run(delete)
+
+    def close(self):
+        if self.flusher is not None:
+            self.flusher.stop()
+        self.flush()
+        self.pool.close()
+
+
+def limits_from_env():
+    """DEFAULT_LIMITS with any GEMINI_USER_* overrides applied"""
+    return {name: int(os.environ.get(env, DEFAULT_LIMITS[name])) for name, env in LIMIT_ENV.items()}
+
+
+_quota = None
+_quota_lock = threading.Lock()
+
+
+def get_user_quota(**options):
+    """Get the shared QuotaManager for this process (options used on first call)
+
+    The database path defaults to GEMINI_USAGE_DB or gemini_usage.db,
+    and limits to the GEMINI_USER_* environment variables.
+    """
+    global _quota
+    if _quota is None:
+        with _quota_lock:
+            if _quota is None:
+                options.setdefault('path', os.environ.get("GEMINI_USAGE_DB", "gemini_usage.db"))
+                options.setdefault('limits', limits_from_env())
+                _quota = QuotaManager(**options)
+    return _quota
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect per-user Gemini usage")
+    parser.add_argument('--path', default=os.environ.get("GEMINI_USAGE_DB", "gemini_usage.db"))
+    parser.add_argument('--day', default=None, help="UTC day as YYYY-MM-DD (default: today)")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--keep-days', type=int, default=90)
+    parser.add_argument('command', choices=['stats', 'purge'])
+    args = parser.parse_args()
+
+    quota = QuotaManager(args.path, flush_interval=0)
+    try:
+        if args.command == 'purge':
+            print(f"🗑️ Removed {quota.purge(args.keep_days)} old usage rows")
+        else:
+            day = args.day or utc_day(time.time())
+            rows = quota.top_users(day, args.top)
+            if not rows:
+                print(f"📭 No usage recorded for {day}")
+            for user_key, requests, tokens in rows:
+                print(f"{user_key:<24} {requests:>6} requests {tokens:>10} tokens")
+    finally:
+        quota.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Pre-generate replies for the Chat page's canned prompts
+
+Enumerates every prompt the Quick Planner, subject help, Study Categories
+and Quick Topics buttons can send (see prompts.canned_prompts) and fills
+the response cache with bounded concurrency. Requests go through the
+process's shared scheduler (get_scheduler) in the "batch" lane, so they
+are paced to the requests-per-minute limit and yield to interactive
+requests made in the same process - e.g. warm(get_client(...), ...)
+called from the app. Run from the command line it is a process of its
+own: its scheduler can't see the app's traffic, so give it an --rpm that
+leaves the app headroom under the API quota. Prompts already cached are
+skipped, so an interrupted run picks up where it left off and a
+scheduled run only refreshes entries close to expiry.
+
+Usage:
+    python warm_cache.py                         # fill whatever is missing
+    python warm_cache.py --concurrency 2 --rpm 10
+    python warm_cache.py --every 86400           # keep running, daily
+    python warm_cache.py --dry-run               # list what would be generated
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from gemini_client import DEFAULT_MODEL, GeminiClient
+from prompts import canned_prompts
+from request_scheduler import get_scheduler
+from response_cache import ResponseCache
+
+def generate_one(client, prompt):
+    """Reply text for prompt; raises RuntimeError if it can't be generated
+
+    The client already retries 429s, 5xx and timeouts. Only finished
+    replies count: cache hits are served as complete answers.
+    """
+    try:
+        response = client.post_generate(prompt, lane="batch")
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(str(e))
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    data = response.json()
+    text = client.reply_text(data)
+    finish_reason = client.finish_reason(data)
+    if text is None or finish_reason != "STOP":
+        raise RuntimeError(f"incomplete reply (finishReason={finish_reason})")
+    return text
+
+
+def warm(client, cache, concurrency=2, refresh_before=86400, dry_run=False):
+    """Generate and cache every canned prompt not already cached; returns counts"""
+    todo, skipped = [], 0
+    for label, prompt in canned_prompts():
+        key = client.cache_key(prompt)
+        if cache.contains(key, min_ttl=refresh_before):
+            skipped += 1
+        else:
+            todo.append((label, prompt, key))
+
+    counts = {'total': skipped + len(todo), 'skipped': skipped, 'warmed': 0, 'failed': 0}
+    if dry_run:
+        for label, _, _ in todo:
+            print(f"   would generate: {label}")
+        return counts
+
+    def work(item):
+        label, prompt, key = item
+        cache.set(key, generate_one(client, prompt), model=client.model)
+        return label
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(work, item): item[0] for item in todo}
+        for future in as_completed(futures):
+            try:
+                print(f"✅ {future.result()}")
+                counts['warmed'] += 1
+            except Exception as e:
+                print(f"❌ {futures[future]}: {e}")
+                counts['failed'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate cached replies for canned Chat prompts")
+    parser.add_argument('--cache-path', default='gemini_cache.db')
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--concurrency', type=int, default=2, help="requests in flight (default: 2)")
+    parser.add_argument('--rpm', type=float, default=10, help="requests per minute (default: 10)")
+    parser.add_argument('--refresh-before', type=float, default=86400,
+                        help="regenerate entries expiring within this many seconds (default: 1 day)")
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--every', type=float, help="repeat every N seconds instead of once")
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    from config import GEMINI_API_KEY
+
+    cache = ResponseCache(args.cache_path, sweep_interval=0)
+    # Burst 1 spaces requests evenly instead of bursting at the start. This
+    # is the process-wide scheduler, so anything else sending from this
+    # process queues ahead of the batch lane; a separate app process is
+    # not seen, hence --rpm.
+    scheduler = get_scheduler(rpm=args.rpm, burst=1, max_retries=args.max_retries)
+    client = GeminiClient(GEMINI_API_KEY, model=args.model, cache=cache, scheduler=scheduler,
+                          max_retries=args.max_retries)
+    try:
+        while True:
+            start = time.perf_counter()
+            counts = warm(client, cache, concurrency=args.concurrency,
+                          refresh_before=args.refresh_before,
+                          dry_run=args.dry_run)
+            print(f"📊 {counts['warmed']} warmed, {counts['skipped']} already cached, "
+                  f"{counts['failed']} failed of {counts['total']} prompts "
+                  f"in {time.perf_counter() - start:.1f}s")
+            if not args.every:
+                if counts['failed']:
+                    raise SystemExit(1)
+                break
+            time.sleep(args.every)
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
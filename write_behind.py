@@ -0,0 +1,95 @@
+import atexit
+import threading
+
+
+class LastLoginBuffer:
+    """Collects last_login stamps in memory and writes them in batches
+
+    Stamps are keyed by user id, so repeated logins by the same user
+    between flushes collapse into a single UPDATE. A background thread
+    flushes every `flush_interval` seconds, or sooner once `max_pending`
+    users are waiting, and a final flush runs at interpreter shutdown.
+    """
+
+    def __init__(self, backend, flush_interval=2.0, max_pending=200, retry=None):
+        self.backend = backend
+        self.retry = retry
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.batches = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="last-login-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def stamp(self, user_id, timestamp):
+        """Record a login; the latest timestamp per user wins"""
+        with self._lock:
+            self._pending[user_id] = timestamp
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def pending(self):
+        """Number of users waiting to be flushed"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write all pending stamps in one transaction; returns rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            def write():
+                with self.backend.connection() as conn:
+                    cursor = conn.cursor()
+                    self.backend.begin_write(cursor)
+                    cursor.executemany('''
+                        UPDATE users
+                        SET last_login = ?
+                        WHERE id = ?
+                    ''', [(timestamp, user_id) for user_id, timestamp in batch.items()])
+                    conn.commit()
+
+            try:
+                if self.retry is not None:
+                    self.retry.run(write)
+                else:
+                    write()
+            except Exception:
+                # Put the batch back without clobbering newer stamps
+                with self._lock:
+                    for user_id, timestamp in batch.items():
+                        self._pending.setdefault(user_id, timestamp)
+                raise
+
+            self.flushed += len(batch)
+            self.batches += 1
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep the stamps and try again on the next tick
+                pass
+
+    def close(self):
+        """Stop the background thread and flush what is left"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()